@@ -6,6 +6,7 @@ simulation is run until there are no more infectious people.
 
 import time
 import infect_sim as infect
+from observers import ProgressReporter
 
 
 def main():
@@ -39,6 +40,7 @@ def main():
 
     # Create environment
     env = infect.Environment(env_params)
+    env.add_observer(ProgressReporter())
 
     # Run simulation
     env.run_sim()
@@ -47,7 +49,11 @@ def main():
     end_time = time.perf_counter()
     run_time = end_time - start_time
 
-    print(f'\nMax R naught: {max(env.report["r_naught"])}')
+    results = env.results()
+    print(f'\nMax R naught: {results.max_r_naught}')
+    print(f'Peak infectious: {results.peak_infectious} on time step '
+          f'{results.peak_epoch}')
+    print(f'Attack rate: {results.attack_rate:.1%}')
     print(f'Run time: {run_time:.4} secs')
 
     # Graph results
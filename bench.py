@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Benchmark the simulation across a matrix of environment sizes, population
+densities and interaction rates with fixed seeds, and compare the results
+against a stored baseline to catch performance regressions.
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+from time import perf_counter
+import numpy as np
+import infect_sim as infect
+from profiling import Profile
+
+# The default benchmark matrix, --full extends env_dim up to 5000
+ENV_DIMS = (100, 300, 1000)
+FULL_ENV_DIMS = (100, 300, 1000, 2000, 5000)
+DENSITIES = (0.01, 0.1)
+INTERACTION_RATES = (2, 4)
+
+
+def bench_case(env_dim, density, interaction_rate, epochs=10, repeat=3,
+               seed=0, move_mode='synchronous', backend='numpy'):
+    """Time setting up a simulation, running a fixed number of time steps and
+    each phase of those time steps. The fastest of the repeats is kept. The
+    repeats run without a profile attached, so its overhead doesn't count,
+    and the phases are timed by one more profiled run.
+
+    Args:
+        env_dim (int): The size of the environment
+        density (float): The fraction of cells that are populated
+        interaction_rate (int): The mean interaction rate
+        epochs (int): The number of time steps to run
+        repeat (int): The number of times to repeat the benchmark
+        seed (int): The seed of every repeat
+        move_mode (str): How people move, see infect_sim.MOVE_MODES
+        backend (str): How time steps are run, see infect_sim.BACKENDS
+
+    Return:
+        dict: The parameters and timings of the case
+    """
+
+    pop_size = max(1, int(density * env_dim ** 2))
+    env_params = {
+        'time_steps': epochs,
+        'env_dim': env_dim,
+        'pop_size': pop_size,
+        # Infect enough people for the outbreak to last the whole benchmark
+        'initially_infected': max(1, pop_size // 100),
+        'interaction_rate': interaction_rate,
+        'infection_rate': .4,
+        'mortality_rate': .02,
+        'recovery_mean': 19,
+        'recovery_sd': 3,
+        'asymptomatic_prob': 0.25,
+        'days_until_infectious': 2,
+        'move_mode': move_mode,
+        'backend': backend
+    }
+
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        env = infect.Environment(env_params, seed)
+        setup = perf_counter() - start
+
+        start = perf_counter()
+        env.run_sim()
+        run = perf_counter() - start
+
+        if best is None or run < best['run_s']:
+            best = {'setup_s': setup, 'run_s': run, 'epochs': env.epoch}
+
+    # Profiling adds overhead to every phase, so the phases are timed
+    # separately from the repeats
+    env = infect.Environment(env_params, seed)
+    env.profile = Profile()
+    env.run_sim()
+    best['phases'] = {phase: totals['time']
+                      for phase, totals in env.profile.summary().items()}
+
+    best['epoch_s'] = best['run_s'] / best['epochs']
+    best['agent_epochs_per_s'] = pop_size / best['epoch_s']
+    return {
+        'name': f'dim{env_dim}-density{density}-rate{interaction_rate}',
+        'env_dim': env_dim,
+        'density': density,
+        'interaction_rate': interaction_rate,
+        'pop_size': pop_size,
+        'move_mode': move_mode,
+        'backend': backend,
+        **best
+    }
+
+
+def run_benchmarks(env_dims=ENV_DIMS, densities=DENSITIES,
+                   interaction_rates=INTERACTION_RATES, on_case=None,
+                   **kwargs):
+    """Benchmark every combination of the matrix.
+
+    Args:
+        env_dims (tuple): The environment sizes
+        densities (tuple): The population densities
+        interaction_rates (tuple): The interaction rates
+        on_case (callable): Called with the result of each case as it
+            finishes
+        **kwargs: Passed on to bench_case()
+
+    Return:
+        dict: The results of each case and a description of the machine
+    """
+
+    cases = []
+    for env_dim, density, rate in itertools.product(env_dims, densities,
+                                                    interaction_rates):
+        cases.append(bench_case(env_dim, density, rate, **kwargs))
+        if on_case is not None:
+            on_case(cases[-1])
+
+    return {
+        'machine': {'python': platform.python_version(),
+                    'numpy': np.__version__,
+                    'platform': platform.platform(),
+                    'processor': platform.processor()},
+        'cases': cases
+    }
+
+
+def compare(results, baseline, tolerance=0.2, min_time=0.001):
+    """Compare results with a baseline. A case regresses if its time per
+    epoch or its setup time is more than the tolerance slower than in the
+    baseline. Cases missing from either are skipped, as are times too short
+    to measure reliably.
+
+    Args:
+        results (dict): The new results, see run_benchmarks()
+        baseline (dict): The baseline results
+        tolerance (float): The allowed slow down as a fraction
+        min_time (float): Baseline times in seconds below this are noise
+
+    Return:
+        list: A (name, metric, baseline, new, ratio) tuple for each
+            regression
+    """
+
+    baseline_cases = {case['name']: case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        old = baseline_cases.get(case['name'])
+        if (old is None or old['move_mode'] != case['move_mode']
+                or old.get('backend', 'numpy') != case['backend']):
+            continue
+        for metric in ('epoch_s', 'setup_s'):
+            if old[metric] < min_time:
+                continue
+            ratio = case[metric] / old[metric]
+            if ratio > 1 + tolerance:
+                regressions.append(
+                    (case['name'], metric, old[metric], case[metric], ratio))
+
+    return regressions
+
+
+def plot_scaling(results, path):
+    """Plot throughput against environment size for each density and
+    interaction rate.
+
+    Args:
+        results (dict): The results, see run_benchmarks()
+        path (str): Where to save the plot
+    """
+
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(7, 7))
+    key = lambda case: (case['density'], case['interaction_rate'])
+    for (density, rate), cases in itertools.groupby(
+            sorted(results['cases'], key=key), key=key):
+        cases = sorted(cases, key=lambda case: case['env_dim'])
+        plt.plot([case['env_dim'] for case in cases],
+                 [case['agent_epochs_per_s'] for case in cases],
+                 marker='o', label=f'Density {density}, interaction {rate}')
+
+    plt.xscale('log')
+    plt.yscale('log')
+    plt.title('Simulation Throughput')
+    plt.xlabel('Environment size (cells per side)')
+    plt.ylabel('Agent time steps per second')
+    plt.legend()
+    plt.savefig(path)
+    plt.close()
+
+
+def main():
+    """Run the benchmarks from the command line, optionally saving them as a
+    new baseline or comparing them against an existing one. Exits with a
+    status of 1 if any case regressed.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--full', action='store_true',
+                        help=f'benchmark env_dim up to {FULL_ENV_DIMS[-1]}')
+    parser.add_argument('--epochs', type=int, default=10,
+                        help='time steps to run per case')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='repeats per case, the fastest is kept')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of every case')
+    parser.add_argument('--move-mode', default='synchronous',
+                        choices=infect.MOVE_MODES, help='how people move')
+    parser.add_argument('--backend', default='numpy',
+                        choices=infect.BACKENDS,
+                        help='how time steps are run')
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the results to this JSON file')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='JSON results to compare against')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2,
+                        help='allowed slow down against the baseline as a '
+                             'fraction (default: 0.2)')
+    parser.add_argument('--min-time', type=float, default=0.001,
+                        help='ignore baseline times in seconds shorter than '
+                             'this (default: 0.001)')
+    parser.add_argument('--plot', default=None,
+                        help='save a plot of the scaling curves here')
+    args = parser.parse_args()
+
+    def on_case(case):
+        print(f'{case["name"]}: {case["pop_size"]} people, '
+              f'setup {case["setup_s"]:.4f}s, '
+              f'{case["epoch_s"] * 1000:.2f}ms/epoch, '
+              f'{case["agent_epochs_per_s"]:.0f} agents/s')
+
+    results = run_benchmarks(FULL_ENV_DIMS if args.full else ENV_DIMS,
+                             on_case=on_case, epochs=args.epochs,
+                             repeat=args.repeat, seed=args.seed,
+                             move_mode=args.move_mode, backend=args.backend)
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.plot is not None:
+        plot_scaling(results, args.plot)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file),
+                                  args.tolerance, args.min_time)
+        for name, metric, old, new, ratio in regressions:
+            print(f'REGRESSION {name} {metric}: {old:.4f}s -> {new:.4f}s '
+                  f'({ratio:.2f}x)')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions beyond {args.tolerance:.0%}')
+
+
+if __name__ == '__main__':
+    main()
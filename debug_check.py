@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Run a few short simulations with the debug checks on, see the 'debug'
+environment parameter, to check that the position index, the grid and the
+running totals stay in agreement across grids and move modes. Exits with a
+status of 1 if any configuration fails.
+"""
+
+import argparse
+import sys
+import infect_sim as infect
+
+# The parameters every configuration starts from
+ENV_PARAMS = {
+    'env_dim': 100,
+    'pop_size': 2000,
+    'initially_infected': 20,
+    'interaction_rate': 4,
+    'infection_rate': .4,
+    'mortality_rate': .02,
+    'recovery_mean': 5,
+    'recovery_sd': 1,
+    'asymptomatic_prob': 0.25,
+    'days_until_infectious': 2
+}
+
+# The changes to ENV_PARAMS of each configuration
+CONFIGS = {
+    'dense': {},
+    'synchronous': {'move_mode': 'synchronous'},
+    'sparse': {'grid': 'sparse'},
+    # Flat cell indices of an environment this large overflow int32
+    'sparse_large': {'grid': 'sparse', 'env_dim': 50000}
+}
+
+
+def check_config(env_params, seed=0, epochs=10):
+    """Run a simulation with the debug checks on.
+
+    Args:
+        env_params (dict): The environment parameters
+        seed (int): The seed of the simulation
+        epochs (int): The number of time steps to run
+
+    Return:
+        str: The failed check, or None if they all passed
+    """
+
+    env = infect.Environment(dict(env_params, time_steps=epochs, debug=True),
+                             seed)
+    try:
+        env.run_sim()
+    except AssertionError as error:
+        return f'epoch {env.epoch}: {error}'
+    return None
+
+
+def main():
+    """Check every configuration from the command line.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--epochs', type=int, default=10,
+                        help='time steps to run per configuration')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of every configuration')
+    args = parser.parse_args()
+
+    failed = False
+    for name, config in CONFIGS.items():
+        failure = check_config(dict(ENV_PARAMS, **config), args.seed,
+                               args.epochs)
+        print(f'{name}: {failure or "ok"}')
+        failed = failed or failure is not None
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Run many replicates of an infection simulation in parallel across all
+cores and summarise them with quantiles of each report time series.
+"""
+
+import argparse
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import infect_sim as infect
+from results import Results, ResultsSet
+
+# Quantiles reported for each time series by default
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def run_replicate(env_params, seed):
+    """Run one replicate of a simulation in the current process.
+
+    Args:
+        env_params (dict): The environment parameters
+        seed (SeedSequence): The seed for this replicate's random numbers
+
+    Return:
+        dict: The report of the simulation
+    """
+
+    env = infect.Environment(env_params, seed)
+    env.run_sim()
+
+    return env.report
+
+
+def iter_replicates(env_params, replicates, seed=None, max_workers=None):
+    """Run replicates of a simulation in a process pool and yield each one as
+    it finishes, which is not necessarily in order.
+
+    Args:
+        env_params (dict): The environment parameters
+        replicates (int): The number of replicates to run
+        seed (int): Seed for the whole ensemble, each replicate gets an
+            independent child seed of it
+        max_workers (int): The number of worker processes, by default one
+            per core
+
+    Yields:
+        tuple: The index of the replicate and its report
+    """
+
+    seeds = np.random.SeedSequence(seed).spawn(replicates)
+    with ProcessPoolExecutor(max_workers) as pool:
+        futures = {pool.submit(run_replicate, env_params, child): index
+                   for index, child in enumerate(seeds)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def summarise(reports, quantiles=QUANTILES):
+    """Compute quantiles of each report time series across replicates at each
+    time step. Runs that ended early are padded with their final values.
+
+    Args:
+        reports (list): The reports of the replicates
+        quantiles (tuple): The quantiles to compute
+
+    Return:
+        dict: An array of shape (len(quantiles), time steps) for each report
+            key
+    """
+
+    runs = ResultsSet.from_reports(reports)
+    return {key: runs.quantiles(key, quantiles) for key in infect.REPORT_KEYS}
+
+
+def run_ensemble(env_params, replicates, seed=None, max_workers=None,
+                 quantiles=QUANTILES, on_result=None):
+    """Run replicates of a simulation in parallel and summarise them.
+
+    Args:
+        env_params (dict): The environment parameters
+        replicates (int): The number of replicates to run
+        seed (int): Seed for the whole ensemble
+        max_workers (int): The number of worker processes, by default one
+            per core
+        quantiles (tuple): The quantiles to compute
+        on_result (callable): Called with the index and report of each
+            replicate as it finishes
+
+    Return:
+        dict: The quantile time series for each report key, see summarise()
+    """
+
+    reports = [None] * replicates
+    for index, report in iter_replicates(env_params, replicates, seed,
+                                         max_workers):
+        reports[index] = report
+        if on_result is not None:
+            on_result(index, report)
+
+    return summarise(reports, quantiles)
+
+
+def main():
+    """Run an ensemble of COVID-19 outbreak simulations from the command line
+    and report quantiles of the peak infectious, deaths and max R naught.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--replicates', type=int, default=100,
+                        help='number of replicates to run')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('-s', '--seed', type=int, default=None,
+                        help='seed for the whole ensemble')
+    parser.add_argument('-p', '--params', default=None,
+                        help='JSON file of environment parameters to use '
+                             'instead of the presets')
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the quantile time series to this JSON '
+                             'file')
+    args = parser.parse_args()
+
+    # Set up environmental parameters for simulation
+    env_params = {
+        'time_steps': 0,  # Run the sim until there are no infectious people
+        'env_dim': 100,
+        'pop_size': 1000,
+        'initially_infected': 3,
+        'interaction_rate': 4,
+        'infection_rate': .4,  # Percent likelihood of spreading the disease
+        'mortality_rate': .02,  # Percent likelihood of dieing from the disease
+        'recovery_mean': 19,  # Mean number of days it takes to recover
+        'recovery_sd': 3,  # Standard deviation of days it takes to recover
+        'asymptomatic_prob': 0.25,  # Probability of being asymptomatic
+        'days_until_infectious': 2
+    }
+    if args.params is not None:
+        with open(args.params) as params_file:
+            env_params.update(json.load(params_file))
+
+    # Summarise each replicate as it finishes
+    peaks, deaths, r_naughts = [], [], []
+
+    def on_result(index, report):
+        results = Results(report)
+        peaks.append(results.peak_infectious)
+        deaths.append(results.final_sizes['dead'])
+        r_naughts.append(results.max_r_naught)
+        print(f'Replicate {index + 1}: peak infectious {peaks[-1]}, '
+              f'dead {deaths[-1]}, max R naught {r_naughts[-1]}',
+              file=sys.stderr)
+
+    summary = run_ensemble(env_params, args.replicates, args.seed,
+                           args.workers, on_result=on_result)
+
+    # Report the spread across replicates
+    print(f'\nQuantiles over {args.replicates} replicates: {QUANTILES}')
+    print(f'Peak infectious: {np.quantile(peaks, QUANTILES)}')
+    print(f'Dead: {np.quantile(deaths, QUANTILES)}')
+    print(f'Max R naught: {np.quantile(r_naughts, QUANTILES)}')
+
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump({
+                'quantiles': list(QUANTILES),
+                'series': {key: value.tolist()
+                           for key, value in summary.items()}
+            }, output_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,225 @@
 """Classes for running simple infection simulations.
 """
 
-import sys
-from random import random, choice
+import json
+import os
+import warnings
+from functools import lru_cache
+from time import perf_counter
 import numpy as np
-import matplotlib.pyplot as plt
+
+
+# State codes for the people in a Population
+SUSCEPTIBLE = 0
+INFECTIOUS = 1
+RECOVERED = 2
+DEAD = 3
+
+# The time series recorded in an Environment's report
+REPORT_KEYS = ('infectious', 'recovered', 'dead', 'not_infected', 'r_naught')
+
+# Marks an empty cell in the environment
+EMPTY = -1
+
+# The eight directions a person can step in
+DIRECTIONS = np.array([
+    [-1, 1], [0, 1], [1, 1],
+    [-1, 0], [1, 0],
+    [-1, -1], [0, -1], [1, -1]
+])
+
+# How people move during a time step. Sequential moves people one at a time
+# in order, each seeing the steps of those before them. Synchronous moves
+# everyone at once from the same starting environment.
+MOVE_MODES = ('sequential', 'synchronous')
+
+# How the phases of a time step are run, see kernels.py
+BACKENDS = ('numpy', 'numba')
+
+# How infectious people infect those around them in synchronous mode, see
+# Environment.infect_all()
+INFECT_MODES = ('agent', 'field')
+
+# Why run_sim() stopped: no one is left infectious, the given number of time
+# steps was run, or one of the optional stopping criteria was met, see
+# Environment.check_stopping()
+STOP_REASONS = ('no_infectious', 'time_steps', 'steady_state', 'time_budget',
+                'peak_passed')
+
+
+@lru_cache(maxsize=None)
+def disc_offsets(radius):
+    """Get the row and column offsets of every cell within a radius of a
+    center cell. The offsets are cached per radius and read-only.
+
+    Args:
+        radius (int): The radius of the disc
+
+    Return:
+        tuple: Arrays of row offsets and column offsets
+    """
+
+    r = int(radius)
+    y, x = np.ogrid[-r: r + 1, -r: r + 1]
+    rows, cols = np.nonzero(x*x + y*y <= r*r)
+    offsets = (rows - r, cols - r)
+    for offset in offsets:
+        offset.flags.writeable = False
+    return offsets
+
+
+@lru_cache(maxsize=None)
+def disc_table(max_radius):
+    """Get the offsets of every disc up to a radius, see disc_offsets(),
+    concatenated into flat arrays. The offsets of radius r are at
+    starts[r]:starts[r + 1].
+
+    Args:
+        max_radius (int): The largest radius
+
+    Return:
+        tuple: The start of each radius's offsets, the row offsets and the
+            column offsets
+    """
+
+    discs = [disc_offsets(radius) for radius in range(max_radius + 1)]
+    starts = np.cumsum([0] + [rows.size for rows, _ in discs])
+    rows = np.concatenate([rows for rows, _ in discs])
+    cols = np.concatenate([cols for _, cols in discs])
+    return starts, rows, cols
+
+
+class DenseGrid:
+    """An environment grid storing the ID of the person in each cell as an
+    int32 array, with EMPTY for an empty cell. Memory scales with the area of
+    the environment.
+    """
+
+    def __init__(self, env_dim):
+        self.cells = np.full((env_dim, env_dim), EMPTY, dtype=np.int32)
+        self.shape = self.cells.shape
+
+    def __getitem__(self, key):
+        return self.cells[key]
+
+    def __setitem__(self, key, value):
+        self.cells[key] = value
+
+    def count(self):
+        """Count the occupied cells in the grid.
+        """
+        return np.count_nonzero(self.cells != EMPTY)
+
+
+class SparseGrid:
+    """An environment grid storing only the occupied cells in a hash map of
+    flat cell index to the ID of the person in that cell. Memory scales with
+    the size of the population instead of the area of the environment.
+    """
+
+    def __init__(self, env_dim):
+        self.env_dim = env_dim
+        self.cells = {}
+        self.shape = (env_dim, env_dim)
+
+    def __getitem__(self, key):
+        flat = self._flatten(key)
+        if flat.ndim == 0:
+            return np.int32(self.cells.get(int(flat), EMPTY))
+        return np.fromiter(
+            (self.cells.get(cell, EMPTY) for cell in flat.ravel().tolist()),
+            dtype=np.int32, count=flat.size
+        ).reshape(flat.shape)
+
+    def __setitem__(self, key, value):
+        flat = self._flatten(key)
+        values = np.broadcast_to(value, flat.shape)
+        for cell, person in zip(flat.ravel().tolist(),
+                                values.ravel().tolist()):
+            if person == EMPTY:
+                self.cells.pop(cell, None)
+            else:
+                self.cells[cell] = person
+
+    def _flatten(self, key):
+        """Convert a (rows, cols) index into flat cell indices.
+        """
+        rows, cols = key
+        # Flat indices overflow int32 once env_dim is over 46340
+        return (np.asarray(rows, dtype=np.int64) * self.env_dim
+                + np.asarray(cols, dtype=np.int64))
+
+    def count(self):
+        """Count the occupied cells in the grid.
+        """
+        return len(self.cells)
+
+
+# The grids an Environment can store its population in
+GRIDS = {
+    'dense': DenseGrid,
+    'sparse': SparseGrid
+}
+
+
+class TimingWheel:
+    """A calendar of the people with an event at each coming time step, eg.
+    becoming infectious, kept in a ring of buckets. Events can be scheduled
+    up to size time steps ahead, so each bucket only ever holds the events
+    of one time step and popping a time step only touches its own people.
+
+    Args:
+        size (int): The number of buckets, more than the furthest ahead an
+            event is scheduled
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.buckets = [[] for _ in range(size)]
+
+    def schedule(self, epochs, persons):
+        """Schedule events.
+
+        Args:
+            epochs (array): The time step of each person's event
+            persons (array): The people
+        """
+
+        order = np.argsort(epochs, kind='stable')
+        epochs, starts = np.unique(epochs[order], return_index=True)
+        for epoch, chunk in zip(epochs.tolist(),
+                                np.split(persons[order], starts[1:])):
+            self.buckets[epoch % self.size].append(chunk)
+
+    def pop(self, epoch):
+        """Take the events of a time step off the calendar.
+
+        Args:
+            epoch (int): The time step
+
+        Return:
+            array: The people with an event at the time step in order of ID
+        """
+
+        bucket = self.buckets[epoch % self.size]
+        if not bucket:
+            return np.empty(0, dtype=np.int64)
+        self.buckets[epoch % self.size] = []
+        return np.sort(np.concatenate(bucket))
 
 
 class Environment:
     """A class for setting up and running the infection simulation.
+
+    Every random number is drawn from one NumPy Generator so a simulation is
+    reproducible from its seed. The seed can be anything accepted by
+    np.random.default_rng(), eg. an int, a SeedSequence or a Generator.
     """
 
-    def __init__(self, env_params):
+    def __init__(self, env_params, seed=None, populate=True):
 
         # Unpack user given environment parameters
+        self.env_params = dict(env_params)
         self.time_steps = env_params['time_steps']
         self.env_dim = env_params['env_dim']
         self.pop_size = env_params['pop_size']
@@ -24,109 +230,585 @@ class Environment:
         self.recovery_mean = env_params['recovery_mean']
         self.recovery_sd = env_params['recovery_sd']
         self.asymptomatic_prob = env_params['asymptomatic_prob']
+        # Whole days, used to schedule events, see schedule(). Floats such as
+        # 2.0 are accepted as they are by sweeps.
         self.days_until_infectious = env_params['days_until_infectious']
-
-        # Keep track of stats during the simulation to use for graphing
+        if self.days_until_infectious != int(self.days_until_infectious):
+            raise ValueError(f'days_until_infectious must be a whole number '
+                             f'of days, got {self.days_until_infectious}.')
+        self.days_until_infectious = int(self.days_until_infectious)
+
+        # Optional consistency checks for testing, off by default since they
+        # scan the whole environment and population
+        self.debug = env_params.get('debug', False)
+
+        # Optional instrumentation of each phase, see profiling.py
+        self.profile = None
+
+        # Optional multi-core stepping of the move and infect phases, see
+        # partition.py
+        self.partition = None
+
+        # Source of all random numbers in the simulation
+        self.rng = np.random.default_rng(seed)
+
+        # How the environment stores who is in each cell, see GRIDS
+        self.grid = env_params.get('grid', 'dense')
+        if self.grid not in GRIDS:
+            raise ValueError(f'Unknown grid: {self.grid}')
+
+        self.move_mode = env_params.get('move_mode', 'sequential')
+        if self.move_mode not in MOVE_MODES:
+            raise ValueError(f'Unknown move mode: {self.move_mode}')
+
+        # Infect one infectious person at a time, or everyone exposed at
+        # once from a field of exposure counts
+        self.infect_mode = env_params.get('infect_mode', 'agent')
+        if self.infect_mode not in INFECT_MODES:
+            raise ValueError(f'Unknown infect mode: {self.infect_mode}')
+        if self.infect_mode == 'field' and self.move_mode != 'synchronous':
+            raise ValueError('The field infect mode needs the synchronous '
+                             'move mode.')
+
+        # Run the move, infect and clean up phases with NumPy or with the
+        # compiled kernels in kernels.py, falling back to NumPy if Numba
+        # isn't installed
+        self.backend = env_params.get('backend', 'numpy')
+        if self.backend not in BACKENDS:
+            raise ValueError(f'Unknown backend: {self.backend}')
+        self.kernels = None
+        if self.backend == 'numba':
+            if self.grid != 'dense':
+                raise ValueError('The numba backend needs the dense grid.')
+            import kernels
+            if kernels.HAVE_NUMBA:
+                self.kernels = kernels
+            else:
+                warnings.warn('Numba is not installed, falling back to the '
+                              'numpy backend.')
+                self.backend = 'numpy'
+
+        # Optional criteria for stopping early, see check_stopping(). Stop
+        # once the relative change of every compartment has stayed within
+        # steady_tolerance for steady_window time steps in a row, once
+        # run_sim() has run for time_budget seconds, or once the peak of
+        # infectious people has provably passed.
+        self.steady_tolerance = env_params.get('steady_tolerance', None)
+        self.steady_window = env_params.get('steady_window', 10)
+        self.time_budget = env_params.get('time_budget', None)
+        self.stop_after_peak = env_params.get('stop_after_peak', False)
+        if self.steady_window < 1:
+            raise ValueError(f'steady_window must be at least 1, got '
+                             f'{self.steady_window}.')
+
+        # Keep running totals of each state, updated as people change state,
+        # to use for graphing
+        self.susceptible = self.pop_size - self.initially_infected
+        self.infectious = self.initially_infected
         self.recovered = 0
         self.dead = 0
-        self.report = {
-            'infectious': [self.initially_infected],
-            'recovered': [0],
-            'dead': [0],
-            'not_infected': [self.pop_size - self.initially_infected],
-            'r_naught': [0]
-        }
+        # Sum and count of has_infected over the recovered and dead, for
+        # calculating R naught
+        self.infected_total = 0
+        self.infected_count = 0
+        self.epoch = 0  # Number of time steps run so far
+        # Most infectious at once so far, and number of time steps in a row
+        # the compartments have been steady, for the stopping criteria
+        self.peak_infectious = self.initially_infected
+        self.steady_epochs = 0
+        self.stop_reason = None  # Why the last run_sim() stopped
+
+        # The stats of each time step are kept in the report unless turned
+        # off, eg. for very long simulations streaming their stats to sinks
+        self.keep_report = env_params.get('keep_report', True)
+        self.report = None
+        self.reset_report()
+        self.sinks = []
+        self.observers = []
 
         # Generate the environment and population
-        self.env = np.full((self.env_dim, self.env_dim), np.Inf)
-        self.pop = {x: Person(self.recovery_mean,
+        self.env = GRIDS[self.grid](self.env_dim)
+
+        # Index of each person's current position in the environment so they
+        # can be located without scanning the grid. A row of -1 means the
+        # person has been removed from the environment.
+        self.rows = np.full(self.pop_size, -1, dtype=np.int32)
+        self.cols = np.full(self.pop_size, -1, dtype=np.int32)
+        self.pop = Population(self.pop_size,
+                              self.recovery_mean,
                               self.recovery_sd,
-                              self.asymptomatic_prob)
-                    for x in range(self.pop_size)}
+                              self.asymptomatic_prob,
+                              self.rng)
+
+        # People infected during the current time step, and calendars of
+        # when each infected person becomes infectious and when their
+        # infection resolves, see schedule()
+        self.new_infections = []
+        self.reset_schedule()
+
+        # Sorted indexes of the people still moving, ie. not recovered or
+        # dead, and of the infectious, updated as people change state so
+        # each time step only visits the people that matter
+        self.reset_index()
+
+        # Optionally keep the grid and population in named shared memory
+        # that other processes can map, see share_memory()
+        self.shared = None
+        self.frames = None
+        if env_params.get('shared_memory', False):
+            self.share_memory()
+
+        # Populate the environment, unless it is going to be restored from
+        # a checkpoint
+        if populate:
+            self.populate()
+            if self.frames is not None:
+                self.frames.publish(self.epoch, **self.frame())
+
+    def share_memory(self):
+        """Move the grid, the position index and the population into named
+        shared memory, and publish a frame of the position, state and
+        interaction rate of each person and the running totals after each
+        time step. Other processes can map both from shared_spec(), see
+        shared.py. Call close() to release the shared memory.
+
+        Raises:
+            ValueError: If the environment doesn't use the dense grid
+        """
+
+        if self.grid != 'dense':
+            raise ValueError('Shared memory needs the dense grid.')
+        from shared import Frames, SharedArrays
 
-        # Populate the environment
-        self.populate()
+        self.shared = SharedArrays.create({
+            'cells': self.env.cells,
+            'rows': self.rows,
+            'cols': self.cols,
+            **{field: getattr(self.pop, field) for field in Population.FIELDS}
+        })
+        self.env.cells = self.shared['cells']
+        self.rows, self.cols = self.shared['rows'], self.shared['cols']
+        for field in Population.FIELDS:
+            setattr(self.pop, field, self.shared[field])
+
+        self.frames = Frames.create(self.frame())
+
+    def frame(self):
+        """Get the arrays published to readers of the shared memory.
+
+        Return:
+            dict: The position, state and interaction rate of each person and
+                the running totals of each state indexed by state code
+        """
+
+        return {
+            'rows': self.rows,
+            'cols': self.cols,
+            'state': self.pop.state,
+            'interaction_rate': self.pop.interaction_rate,
+            'counts': np.array([self.susceptible, self.infectious,
+                                self.recovered, self.dead], dtype=np.int64)
+        }
+
+    def shared_spec(self):
+        """Get what another process needs to map the shared memory of the
+        simulation. It can be saved as JSON.
+
+        Return:
+            dict: The specs of the live arrays and of the published frames,
+                see shared.SharedArrays.attach() and shared.Frames.attach(),
+                and the environment parameters
+
+        Raises:
+            ValueError: If the simulation isn't in shared memory
+        """
+
+        if self.shared is None:
+            raise ValueError('The simulation is not in shared memory.')
+        return {'arrays': self.shared.spec, 'frames': self.frames.spec,
+                'env_params': self.env_params}
+
+    def close(self):
+        """Release any shared memory, copying the arrays back into private
+        memory so the simulation can still be used.
+        """
+
+        if self.shared is None:
+            return
+        self.env.cells = self.env.cells.copy()
+        self.rows, self.cols = self.rows.copy(), self.cols.copy()
+        for field in Population.FIELDS:
+            setattr(self.pop, field, getattr(self.pop, field).copy())
+        self.shared.close()
+        self.frames.close()
+        self.shared = self.frames = None
 
     def populate(self):
         """Populate the environment randomly with the appropriate amount of
         infected and non-infected people with no overlap.
+
+        Raises:
+            ValueError: If the population doesn't fit in the environment or is
+                smaller than the number of initially infected people
         """
 
         # Error check user
         if self.pop_size > self.env_dim ** 2:
-            sys.exit('Population larger than environment can support.')
+            raise ValueError('Population larger than environment can support.')
 
         if self.pop_size < self.initially_infected:
-            sys.exit(
+            raise ValueError(
                 'Population smaller than the number of initially infected '
                 'people defined.'
             )
 
-        count_infected = 0  # Track the number of initially infected people
-        for person in self.pop:
-            while True:
-                row = np.random.randint(self.env_dim)
-                col = np.random.randint(self.env_dim)
-                if self.env[row, col] == np.Inf:
-                    self.env[row, col] = person
-                else:
-                    continue
-                if count_infected < self.initially_infected:
-                    self.pop[person].infected = True
-                    count_infected += 1
-                break
-
-    def move(self, person):
+        # Put each person in a distinct random cell
+        cells = self.sample_cells(self.pop_size)
+        self.rows[:], self.cols[:] = np.divmod(cells, self.env_dim)
+        self.env[self.rows, self.cols] = np.arange(self.pop_size)
+
+        # Infect random people
+        infected = self.rng.choice(self.pop_size, self.initially_infected,
+                                   replace=False)
+        self.pop.state[infected] = INFECTIOUS
+        self.pop.infected_at[infected] = self.epoch
+        self.schedule(infected)
+        self.reset_index()
+
+        if self.debug:
+            self.check_positions()
+            self.check_counts()
+
+    def sample_cells(self, size):
+        """Draw distinct random cells of the environment in a random order.
+
+        Args:
+            size (int): The number of cells to draw
+
+        Return:
+            array: Flat indices of the cells
+        """
+
+        area = self.env_dim ** 2
+
+        # Shuffling every cell, as Generator.choice() without replacement
+        # does, allocates the whole area, which is wasteful when the
+        # environment is sparsely populated. Instead draw cells and drop any
+        # repeats until there are enough.
+        if size > area // 2:
+            return self.rng.permutation(area)[:size]
+
+        cells = np.empty(0, dtype=np.int64)
+        while cells.size < size:
+            cells = np.concatenate([
+                cells, self.rng.integers(area, size=size - cells.size)])
+            _, first = np.unique(cells, return_index=True)
+            cells = cells[np.sort(first)]
+        return cells
+
+    def check_positions(self):
+        """Check that the position index agrees with the environment, ie.
+        every indexed person is in the cell the index points to and nobody
+        else is in the environment.
+
+        Raises:
+            AssertionError: If the index and the environment disagree
+        """
+
+        indexed = np.flatnonzero(self.rows >= 0)
+        occupants = self.env[self.rows[indexed], self.cols[indexed]]
+        assert np.array_equal(occupants, indexed), \
+            'Position index does not match the environment.'
+        assert self.env.count() == indexed.size, \
+            'Environment holds people missing from the position index.'
+
+    def check_counts(self):
+        """Check that the running totals agree with totals recomputed from
+        the population.
+
+        Raises:
+            AssertionError: If a running total has drifted
+        """
+
+        counts = np.bincount(self.pop.state, minlength=4)
+        assert (self.susceptible, self.infectious, self.recovered,
+                self.dead) == tuple(counts), \
+            'Running state totals do not match the population.'
+        resolved = self.pop.state >= RECOVERED  # Recovered or dead
+        assert self.infected_total == self.pop.has_infected[resolved].sum(), \
+            'Running has_infected total does not match the population.'
+        assert self.infected_count == np.count_nonzero(resolved), \
+            'Running resolved count does not match the population.'
+        assert np.array_equal(self.mobile_persons,
+                              np.flatnonzero(self.pop.state <= INFECTIOUS)), \
+            'Index of moving people does not match the population.'
+        assert np.array_equal(self.infectious_persons,
+                              np.flatnonzero(self.pop.state == INFECTIOUS)), \
+            'Index of infectious people does not match the population.'
+
+    def move(self, person, order=None):
         """Take one random step from the current position for a given subject
         in the population.
 
         Args:
             person (int): The person in the population who is moving
+            order (array): The order to try directions in as indices into
+                DIRECTIONS, by default a random order
 
         Return:
             int: Returns 0 if the person did not move or 1 if they did
         """
 
-        position = np.where(self.env == person)  # Current position in env
-        directions = [
-            [-1, 1], [0, 1], [1, 1],
-            [-1, 0], [1, 0],
-            [-1, -1], [0, -1], [1, -1]
-        ]
-
-        while True:
-            # Positions exhausted so person doesn't move
-            if directions == []:
-                return 0
-
-            step = choice(directions)  # Choose random direction to step
-            new_position = [position[0] + step[0],
-                            position[1] + step[1]]
+        if order is None:
+            order = self.rng.permutation(len(DIRECTIONS))
+        row, col = int(self.rows[person]), int(self.cols[person])
 
+        # Try each direction in turn until one leads to an empty cell
+        for step_row, step_col in DIRECTIONS[order].tolist():
             # The environment has no borders
             # Wrap around to other side if moving past the bounds of the
             # environment array
-            for coordinate, _ in enumerate(new_position):
-                if new_position[coordinate] == -1:
-                    new_position[coordinate] = self.env_dim - 1
-                if new_position[coordinate] == self.env_dim:
-                    new_position[coordinate] = 0
+            new_row = (row + step_row) % self.env_dim
+            new_col = (col + step_col) % self.env_dim
 
             # Check if new position is empty
-            if self.env[new_position[0], new_position[1]] == np.Inf:
+            if self.env[new_row, new_col] == EMPTY:
                 # Move subject to new position
-                self.env[new_position[0], new_position[1]] = person
+                self.env[new_row, new_col] = person
                 # Remove subject from previous position
-                self.env[position[0], position[1]] = np.Inf
+                self.env[row, col] = EMPTY
+                self.rows[person], self.cols[person] = new_row, new_col
+                return 1  # Person moved
 
-            # New position is full so choose a new random step
-            else:
-                directions.remove(step)  # Remove from future choices
-                continue
+        # Positions exhausted so person doesn't move
+        return 0
+
+    def move_all(self, persons=None):
+        """Take one random step from the current position for every given
+        person at once. Each person only tries one direction and can only
+        step into a cell that was empty at the start of the time step. If
+        several people step into the same cell a random one of them gets it.
+        Anyone who doesn't get a cell stays put.
+
+        Args:
+            persons (array): The people who are moving, by default everyone
+                alive and not recovered
+
+        Return:
+            int: The number of people who moved
+        """
+
+        if persons is None:
+            persons = self.mobile_persons
+
+        # Choose a random direction to step for everyone, wrapping around to
+        # the other side past the bounds of the environment array
+        steps = DIRECTIONS[self.rng.integers(len(DIRECTIONS),
+                                             size=len(persons))]
+        new_rows = (self.rows[persons] + steps[:, 0]) % self.env_dim
+        new_cols = (self.cols[persons] + steps[:, 1]) % self.env_dim
+
+        # Settle who gets each empty cell by shuffling those stepping into
+        # empty cells and keeping the first one in line for each cell
+        free = np.flatnonzero(self.env[new_rows, new_cols] == EMPTY)
+        line = self.rng.permutation(free)
+        cells = new_rows[line] * self.env_dim + new_cols[line]
+        _, first = np.unique(cells, return_index=True)
+        winners = line[first]
+        movers = persons[winners]
+
+        # Move everyone at once
+        self.env[self.rows[movers], self.cols[movers]] = EMPTY
+        self.env[new_rows[winners], new_cols[winners]] = movers
+        self.rows[movers] = new_rows[winners]
+        self.cols[movers] = new_cols[winners]
+
+        return movers.size
+
+    def move_and_infect(self, persons):
+        """Move each given person in turn, each seeing the steps of those
+        before them. Infectious people have a chance to infect those around
+        them straight after moving.
+
+        Args:
+            persons (array): The people who are moving, in order
+
+        Return:
+            None
+        """
+
+        profile = self.profile
+
+        # Draw the order everyone tries directions in at once
+        orders = self.rng.permuted(
+            np.tile(np.arange(len(DIRECTIONS), dtype=np.int8),
+                    (len(persons), 1)), axis=1)
+
+        if self.backend == 'numba':
+            if profile is not None:
+                profile.start('move_and_infect')
+            infected = self.kernels.move_and_infect(
+                self.env.cells, self.rows, self.cols, self.pop.state,
+                self.pop.interaction_rate, self.pop.has_infected, persons,
+                orders, DIRECTIONS, *self.disc_table(), self.infection_rate,
+                self.rng)
+            self.new_infections.append(infected)
+            self.susceptible -= infected.size
+            self.infectious += infected.size
+            if profile is not None:
+                profile.stop()
+            return
+
+        for person, order in zip(persons.tolist(), orders):
+            if profile is not None:
+                profile.start('move')
+            self.move(person, order)
+            if profile is not None:
+                profile.stop()
+            if self.pop.state[person] == INFECTIOUS:
+                if profile is not None:
+                    profile.start('infect')
+                self.infect(person)
+                if profile is not None:
+                    profile.stop()
+
+    def infect_all(self, persons):
+        """Give each given infectious person in turn a chance to infect those
+        around them, or in the field infect mode give everyone exposed to
+        them a chance to be infected at once, see infect_field().
+
+        Args:
+            persons (array): The infectious people, in order
+
+        Return:
+            None
+        """
+
+        profile = self.profile
+        if profile is not None:
+            profile.start('infect')
+
+        if self.infect_mode == 'field':
+            self.infect_field(persons)
+        elif self.backend == 'numba':
+            infected = self.kernels.infect_all(
+                self.env.cells, self.rows, self.cols, self.pop.state,
+                self.pop.interaction_rate, self.pop.has_infected, persons,
+                *self.disc_table(), self.infection_rate, self.rng)
+            self.new_infections.append(infected)
+            self.susceptible -= infected.size
+            self.infectious += infected.size
+        else:
+            for person in persons:
+                self.infect(person)
+
+        if profile is not None:
+            profile.stop()
+
+    def infect_field(self, persons):
+        """Infect everyone exposed to the given infectious people at once.
+        The discs of the infectious are scattered into a count of exposures
+        at each cell, and a susceptible person exposed k times is infected
+        with a chance of 1 - (1 - infection_rate)^k in a single draw. That's
+        the same chance as being given k separate chances, one by each
+        person they're exposed to, as in the agent infect mode. Each person
+        infected is put down to one of the people they were exposed to at
+        random, so has_infected and R naught stay meaningful.
+
+        Args:
+            persons (array): The infectious people
+
+        Return:
+            None
+        """
+
+        # Only people with a positive interaction rate expose others
+        radii = self.pop.interaction_rate[persons]
+        persons, radii = persons[radii > 0], radii[radii > 0]
+
+        # The cells of each infectious person's disc, one radius at a time,
+        # along with who they're exposed to
+        cells, sources = [], []
+        for radius in np.unique(radii).tolist():
+            centers = persons[radii == radius]
+            row_offsets, col_offsets = disc_offsets(radius)
+            disc = (((self.rows[centers, None] + row_offsets) % self.env_dim)
+                    * self.env_dim
+                    + (self.cols[centers, None] + col_offsets) % self.env_dim)
+            # A disc wider than the environment wraps onto itself so only
+            # count each cell once
+            if 2 * radius + 1 > self.env_dim:
+                disc.sort(axis=1)
+                disc[:, 1:][disc[:, 1:] == disc[:, :-1]] = -1
+            cells.append(disc.ravel())
+            sources.append(np.repeat(centers, disc.shape[1]))
+        if not cells:
+            return
+        cells, sources = np.concatenate(cells), np.concatenate(sources)
+        keep = cells >= 0
+        cells, sources = cells[keep], sources[keep]
+
+        # The susceptible people in those cells, and how many times each of
+        # them is exposed
+        exposed = self.env[np.divmod(cells, self.env_dim)]
+        keep = exposed != EMPTY
+        keep[keep] = self.pop.state[exposed[keep]] == SUSCEPTIBLE
+        exposed, sources = exposed[keep], sources[keep]
+        order = np.argsort(exposed, kind='stable')
+        exposed, sources = exposed[order], sources[order]
+        candidates, starts, exposures = np.unique(
+            exposed, return_index=True, return_counts=True)
+
+        # See who becomes infected
+        chance = 1 - (1 - self.infection_rate) ** exposures
+        infected = self.rng.random(candidates.size) <= chance
+        candidates = candidates[infected]
+        self.pop.state[candidates] = INFECTIOUS
+        if candidates.size:
+            self.new_infections.append(candidates)
+        self.susceptible -= candidates.size
+        self.infectious += candidates.size
+
+        # Put each infection down to a random one of the exposures
+        picks = starts[infected] + (self.rng.random(candidates.size)
+                                    * exposures[infected]).astype(np.int64)
+        np.add.at(self.pop.has_infected, sources[picks], 1)
+
+    def disc_table(self):
+        """Get the disc offsets of every interaction rate up to the highest
+        one in the population as flat arrays for the compiled kernels.
+
+        Return:
+            tuple: The start of each radius's offsets and the row and column
+                offsets of every radius
+        """
+        return disc_table(max(0, int(self.pop.interaction_rate.max())))
+
+    def disc_cells(self, row, col, radius):
+        """Get the environment indices of the cells within a radius of a
+        given cell. The environment has no borders so the disc wraps around
+        to the other side past the bounds of the environment array.
+
+        Args:
+            row (int): The row of the center cell
+            col (int): The column of the center cell
+            radius (int): The radius of the disc
 
-            break
+        Return:
+            tuple: Arrays of row indices and column indices
+        """
+
+        row_offsets, col_offsets = disc_offsets(radius)
+        rows = (row_offsets + row) % self.env_dim
+        cols = (col_offsets + col) % self.env_dim
 
-        return 1  # Person moved
+        # A disc wider than the environment wraps onto itself so only keep
+        # each cell once
+        if 2 * radius + 1 > self.env_dim:
+            cells = np.unique(rows * self.env_dim + cols)
+            rows, cols = np.divmod(cells, self.env_dim)
+
+        return rows, cols
 
     def infect(self, person):
         """See if an infectious person infects others.
@@ -139,217 +821,555 @@ class Environment:
         """
 
         # Only run if person has a positive interaction rate
-        if self.pop[person].interaction_rate > 0:
-            center = np.where(self.env == person)  # Position of the subject
-            x_center, y_center = int(center[0]), int(center[1])
-            n = self.env_dim
-            # Radius of circle surrounding subject
-            r = self.pop[person].interaction_rate
-
-            # Create a mask to look for people surrounding the subject
-            y, x = np.ogrid[-x_center: n-x_center, -y_center: n-y_center]
-            mask = x*x + y*y <= r*r
-
-            # Get environment indices of the mask
-            mask_indices = np.where(mask)
-
-            # Create a list of people in the circle surrounding the subject
-            # who are not already infected
-            persons = [int(x) for x in self.env[mask_indices]
-                       if (x != np.Inf) and (
-                           [self.pop[x].infected,
-                            self.pop[x].recovered,
-                            self.pop[x].alive
-                            ] == [False, False, True])]
+        if self.pop.interaction_rate[person] > 0:
+            # Get environment indices of the circle surrounding the subject
+            mask_indices = self.disc_cells(self.rows[person],
+                                           self.cols[person],
+                                           self.pop.interaction_rate[person])
+
+            # Get the people in the circle surrounding the subject who are
+            # not already infected
+            occupants = self.env[mask_indices]
+            persons = occupants[occupants != EMPTY]
+            persons = persons[self.pop.state[persons] == SUSCEPTIBLE]
 
             # See if these people become infected
-            for other_person in persons:
-                if random() <= self.infection_rate:
-                    self.pop[other_person].infected = True
-                    self.pop[person].has_infected += 1
+            infected = persons[
+                self.rng.random(persons.size) <= self.infection_rate]
+            self.pop.state[infected] = INFECTIOUS
+            if infected.size:
+                self.new_infections.append(infected)
+            self.pop.has_infected[person] += infected.size
+            self.susceptible -= infected.size
+            self.infectious += infected.size
 
     def clean_up(self, remove_persons=True):
-        """Traverse the environment and for each person do the following:
-                - If someone is infected, then
-                    - See if they are contagious yet
-                        - If they are asymptomatic they have the defined
-                        interaction rate
-                        - If they are symptomatic they have a random rounded
-                        normalized interaction rate (mean: 1, sd: 0.25)
-                    - See if they die
-                        - If they do, remove them from the environment
-                        - If not, advance their days_infected variable
-                            - Check if they recover
-                    - Save stats for the time step
+        """Schedule the infections of this time step, then for each infected
+        person with an event this time step do the following:
+                - See if they are contagious yet
+                    - If they are asymptomatic they have a random rounded
+                    normalized interaction rate around the defined
+                    interaction rate
+                    - If they are symptomatic they have a random rounded
+                    normalized interaction rate (mean: 0.75, sd: 0.25)
+                - Check if they have reached the end of their infection
+                    - See if they die, otherwise they recover
+                    - Remove them from the environment if called for
+            Then save stats for the time step.
+
+        Only the people whose state changes this time step are looked at,
+        see schedule(). Each step is done for all of them at once with one
+        random draw per step.
+
         Args:
-            remove_persons (bool): If True dead and recovered people are not
-                removed from the environment. Useful for the PyGame
+            remove_persons (bool): If True dead and recovered people are
+                removed from the environment. Set to False for the PyGame
                 visualization.
 
         Return:
             None
         """
 
-        for ix, iy in np.ndindex(self.env.shape):
-            dead, recovered_ = False, False
-            if self.env[ix, iy] != np.Inf:  # Cell is occupied by a person
-                person = self.env[ix, iy]
-
-                # Check if person is alive, infected and hasn't recovered
-                infectious_conditions = [
-                    self.pop[person].alive,
-                    self.pop[person].infected,
-                    self.pop[person].recovered
-                ]
-                if infectious_conditions == [True, True, False]:
-                    self.pop[person].days_infected += 1
-                    # It takes 2 days to become infectious and for that
-                    # person's interaction rate to potentially change
-                    if self.pop[person].days_infected == self.days_until_infectious:
-                        # If they are asymptomatic they have a randomly
-                        # assigned normally distributed interaction rate
-                        # with the standard deviation equal to half that of
-                        # the mean interaction rate
-                        if self.pop[person].asymptomatic:
-                            self.pop[person].interaction_rate = \
-                                round(np.random.normal(self.interaction_rate,
-                                                       0.5 * self.interaction_rate))
-                        # Else person is symptomatic and thus either
-                        # quarantines at home or is hospitalized (ie. lower
-                        # interaction rate)
-                        else:
-                            self.pop[person].interaction_rate = \
-                                round(np.random.normal(0.75, 0.25))
-
-                    # Check if they recover and update their status if so
-                    if self.pop[person].days_infected == \
-                            self.pop[person].days_to_recover:
-                        # See if the infected person dies
-                        self.death_roll(person)
-                        # If they died increment the total dead thus far variable
-                        # and remove them from the environment if called for
-                        if not self.pop[person].alive:
-                            dead = True
-                        else:
-                            self.pop[person].recovered = True
-                            self.pop[person].infected = False
-                            self.recovered += 1  # Track total recovered
-                            recovered_ = True
-
-                # Remove them from environment if called for
-            if remove_persons and (dead or recovered_):
-                self.env[ix, iy] = np.Inf
+        profile = self.profile
+        if profile is not None:
+            profile.start('clean_up')
+
+        if self.new_infections:
+            infected = np.sort(np.concatenate(self.new_infections))
+            self.new_infections = []
+            self.pop.infected_at[infected] = self.epoch
+            self.schedule(infected)
+            self.infectious_persons = np.insert(
+                self.infectious_persons,
+                np.searchsorted(self.infectious_persons, infected), infected)
+
+        # Those becoming infectious this time step, unless their infection
+        # has already resolved, and those whose infection resolves
+        turning = self.becomes_infectious.pop(self.epoch)
+        turning = turning[self.pop.state[turning] == INFECTIOUS]
+        resolved = self.resolves.pop(self.epoch)
+
+        if self.backend == 'numba':
+            dead, recovered, infected_total = self.kernels.clean_up(
+                self.env.cells, self.rows, self.cols, self.pop.state,
+                self.pop.interaction_rate, self.pop.asymptomatic,
+                self.pop.has_infected, turning, resolved,
+                self.interaction_rate, self.mortality_rate, remove_persons,
+                self.rng)
+            self.infectious -= dead + recovered
+            self.dead += dead
+            self.recovered += recovered
+            self.infected_total += infected_total
+            self.infected_count += dead + recovered
+        else:
+            self.clean_up_infected(turning, resolved, remove_persons)
+
+        # Those at the end of their infection stop moving
+        if resolved.size:
+            self.infectious_persons = np.delete(
+                self.infectious_persons,
+                np.searchsorted(self.infectious_persons, resolved))
+            self.mobile_persons = np.delete(
+                self.mobile_persons,
+                np.searchsorted(self.mobile_persons, resolved))
+
+        if profile is not None:
+            profile.stop()
+
+        self.epoch += 1
         self.save_stats()
+        if self.frames is not None:
+            self.frames.publish(self.epoch, **self.frame())
+
+        if profile is not None:
+            profile.end_epoch(self.epoch)
+
+        if self.debug:
+            self.check_positions()
+            self.check_counts()
+
+    def clean_up_infected(self, infectious, resolved, remove_persons):
+        """Advance the infection of the people with an event this time step
+        with NumPy, see clean_up().
+
+        Args:
+            infectious (array): The people becoming infectious
+            resolved (array): The people at the end of their infection
+            remove_persons (bool): If True dead and recovered people are
+                removed from the environment
+
+        Return:
+            None
+        """
 
-    def death_roll(self, person):
-        """See if an infected person dies or not.
+        # It takes a few days to become infectious and for that person's
+        # interaction rate to potentially change
+        draws = self.rng.normal(size=infectious.size)
+        # If they are asymptomatic they have a randomly assigned normally
+        # distributed interaction rate with the standard deviation equal to
+        # half that of the mean interaction rate. Else they are symptomatic
+        # and thus either quarantine at home or are hospitalized (ie. lower
+        # interaction rate).
+        rates = np.where(
+            self.pop.asymptomatic[infectious],
+            self.interaction_rate + 0.5 * self.interaction_rate * draws,
+            0.75 + 0.25 * draws
+        )
+        self.pop.interaction_rate[infectious] = np.round(rates)
+
+        # See if those at the end of their infection die or recover
+        dies = self.rng.random(resolved.size) <= self.mortality_rate
+        self.pop.state[resolved] = np.where(dies, DEAD, RECOVERED)
+        self.infectious -= resolved.size
+        self.dead += np.count_nonzero(dies)
+        self.recovered += resolved.size - np.count_nonzero(dies)
+        self.infected_total += int(self.pop.has_infected[resolved].sum())
+        self.infected_count += resolved.size
+
+        # Remove them from environment if called for
+        if remove_persons:
+            self.env[self.rows[resolved], self.cols[resolved]] = EMPTY
+            self.rows[resolved] = self.cols[resolved] = -1
+
+    def reset_index(self):
+        """Rebuild the indexes of the moving and the infectious people from
+        the state of the population.
+        """
+
+        self.mobile_persons = np.flatnonzero(self.pop.state <= INFECTIOUS)
+        self.infectious_persons = np.flatnonzero(
+            self.pop.state == INFECTIOUS)
+
+    def reset_schedule(self):
+        """Make empty calendars reaching far enough ahead for the longest
+        infection in the population.
+        """
+
+        horizon = max(self.days_until_infectious,
+                      int(self.pop.days_to_recover.max(initial=0)), 1)
+        self.becomes_infectious = TimingWheel(horizon)
+        self.resolves = TimingWheel(horizon)
+
+    def schedule(self, persons):
+        """Put the events of infected people on the calendars. Someone
+        infected during time step n has been infected for a day after its
+        clean up, becomes infectious in the clean up of time step
+        n + days_until_infectious - 1 and their infection resolves in the
+        clean up of time step n + days_to_recover - 1. Events that have
+        already passed are skipped.
 
         Args:
-            person (int): The person who may die.
+            persons (array): The infected people, with infected_at set
 
         Return:
             None
         """
 
-        if random() <= self.mortality_rate:
-            self.pop[person].alive = False
-            self.dead += 1
+        infected_at = self.pop.infected_at[persons]
+        if self.days_until_infectious > 0:
+            turning = infected_at + self.days_until_infectious - 1
+            coming = turning >= self.epoch
+            self.becomes_infectious.schedule(turning[coming], persons[coming])
+        resolving = infected_at + self.pop.days_to_recover[persons] - 1
+        coming = resolving >= self.epoch
+        self.resolves.schedule(resolving[coming], persons[coming])
+
+    def stats(self):
+        """Get the number of infectious, recovered, dead, and not infected
+        people in the population and the R naught value.
+
+        Return:
+            dict: The current value of each report key
+        """
+
+        profile = self.profile
+        if profile is not None:
+            profile.start('calculate_r')
+        r_naught = float(self.calculate_r())
+        if profile is not None:
+            profile.stop()
+
+        return {
+            'infectious': int(self.infectious),
+            'recovered': int(self.recovered),
+            'dead': int(self.dead),
+            'not_infected': int(self.susceptible),
+            'r_naught': r_naught
+        }
+
+    def reset_report(self):
+        """Start a new report holding the current stats, if the report is
+        kept.
+        """
+
+        if self.keep_report:
+            self.report = {key: [value] for key, value in self.stats().items()}
 
     def save_stats(self):
-        """Save the number of infectious, recovered, and dead people in the
-        population to the report dictionary.
+        """Save the stats of the current time step to the report dictionary
+        and write them to any sinks.
         """
 
-        self.report['infectious'].append(
-            sum(
-                [1 for person in self.pop if ([
-                    self.pop[person].alive,
-                    self.pop[person].infected,
-                    self.pop[person].recovered
-                ]) == [True, True, False]]
-            )
-        )
+        profile = self.profile
+        if profile is not None:
+            profile.start('save_stats')
 
-        self.report['recovered'].append(self.recovered)
+        stats = self.stats()
+        if self.keep_report:
+            for key, value in stats.items():
+                self.report[key].append(value)
+        self.write_sinks(stats)
 
-        self.report['dead'].append(self.dead)
+        if profile is not None:
+            profile.stop()
 
-        self.report['not_infected'].append(
-            self.pop_size -
-            self.report['infectious'][-1] -
-            self.report['recovered'][-1] -
-            self.report['dead'][-1]
-        )
+    def add_sink(self, sink):
+        """Stream the stats of each time step to a sink, see sinks.py.
+
+        Args:
+            sink (EpochSink): The sink to write to
+
+        Return:
+            None
+        """
+        self.sinks.append(sink)
+
+    def add_observer(self, observer):
+        """Notify an observer as the simulation runs, see observers.py.
+        run_sim() is silent when no observers are attached.
+
+        Args:
+            observer (Observer): The observer to notify
+
+        Return:
+            None
+        """
+        self.observers.append(observer)
+
+    def write_sinks(self, stats):
+        """Write the stats of the current time step to every sink.
+
+        Args:
+            stats (dict): The stats to write, see stats()
+
+        Return:
+            None
+        """
+
+        if self.sinks:
+            record = {'epoch': self.epoch, **stats}
+            for sink in self.sinks:
+                sink.write(record)
 
     def calculate_r(self):
         """Calculate the R naught value of an infection simulation
         environment.
         """
-        # Calculate R naught value for virus
-        infected_total = 0
-        infected_count = 0
-        for person in self.pop.keys():
-            if self.pop[person].recovered or not self.pop[person].alive:
-                infected_total += self.pop[person].has_infected
-                infected_count += 1
-
+        # Calculate R naught value for virus from the running totals over
+        # the recovered and dead
         # Don't allow a division by zero error
-        if infected_total != 0:
-            r_naught = round(infected_total / infected_count, 2)
+        if self.infected_total != 0:
+            r_naught = round(self.infected_total / self.infected_count, 2)
         else:
             r_naught = 0
 
         return r_naught
 
-    def run_sim(self):
+    def compartments(self):
+        """Get the number of susceptible, infectious, recovered and dead
+        people.
+
+        Return:
+            array: The size of each compartment
+        """
+        return np.array([self.susceptible, self.infectious, self.recovered,
+                         self.dead], dtype=np.int64)
+
+    def check_stopping(self, previous, start_time):
+        """Check the optional stopping criteria after a time step.
+
+        The compartments are steady when none of them changed by more than
+        steady_tolerance of its previous size, counted from the first
+        infection or resolution. The peak of infectious people
+        has provably passed once the infectious and susceptible together are
+        fewer than the peak, as no later time step can have more infectious
+        people than that.
+
+        Args:
+            previous (array): The compartments before the time step, see
+                compartments()
+            start_time (float): When run_sim() started, from perf_counter()
+
+        Return:
+            str: The reason to stop, see STOP_REASONS, or None to carry on
+        """
+
+        # Nothing changes while the initially infected are still latent, so
+        # only count steady time steps once someone has been infected or
+        # their infection has resolved
+        started = (self.susceptible < self.pop_size - self.initially_infected
+                   or self.recovered + self.dead > 0)
+        if self.steady_tolerance is not None and started:
+            current = self.compartments()
+            change = np.abs(current - previous) / np.maximum(previous, 1)
+            if change.max() <= self.steady_tolerance:
+                self.steady_epochs += 1
+            else:
+                self.steady_epochs = 0
+            if self.steady_epochs >= self.steady_window:
+                return 'steady_state'
+
+        if (self.time_budget is not None
+                and perf_counter() - start_time >= self.time_budget):
+            return 'time_budget'
+
+        if (self.stop_after_peak
+                and self.infectious + self.susceptible < self.peak_infectious):
+            return 'peak_passed'
+
+        return None
+
+    def run_sim(self, checkpoint_every=None, checkpoint_path=None):
         """Run the infection simulation and save relevant statistics at each
-        time step.
+        time step. A simulation restored from a checkpoint carries on from
+        where it was saved. Why the simulation stopped is kept in
+        stop_reason and in the report.
+
+        Args:
+            checkpoint_every (int): Save a checkpoint every this many time
+                steps, by default never
+            checkpoint_path (str): Where to save the checkpoints, see
+                save_checkpoint(), needed with checkpoint_every
+
+        Return:
+            None
+
+        Raises:
+            ValueError: If checkpoint_every is given without checkpoint_path
         """
 
+        if checkpoint_every and checkpoint_path is None:
+            raise ValueError('checkpoint_every needs a checkpoint_path.')
+
         # Reset the report variable in case a previous simulation was run
-        self.report = {
-            'infectious': [self.initially_infected],
-            'recovered': [0],
-            'dead': [0],
-            'not_infected': [self.pop_size - self.initially_infected],
-            'r_naught': [0]
-        }
+        # and start the sinks off with the initial stats
+        if self.epoch == 0:
+            self.reset_report()
+            self.write_sinks(self.stats())
 
         # For each epoch (time step) and for each person in the population,
         # if they are still alive and not recovered move them. If they are also
         # infected they have a chance to infect those around them.
-        running = True
-        epoch = 0
-        while running:
-            for person in self.pop:
-                if (self.pop[person].alive, self.pop[person].recovered) == \
-                        (True, False):
-                    self.move(person)
-                    if self.pop[person].infected:
-                        self.infect(person)
-            self.report['r_naught'].append(
-                self.calculate_r()
-            )
+        for observer in self.observers:
+            observer.on_start(self)
+
+        profile = self.profile
+        start_time = perf_counter()
+        self.stop_reason = None
+        while self.stop_reason is None:
+            previous = self.compartments()
+            if self.partition is not None:
+                if profile is not None:
+                    profile.start('move_and_infect')
+                self.partition.step(self.mobile_persons)
+                if profile is not None:
+                    profile.stop()
+            elif self.move_mode == 'synchronous':
+                if profile is not None:
+                    profile.start('move')
+                self.move_all(self.mobile_persons)
+                if profile is not None:
+                    profile.stop()
+                self.infect_all(self.infectious_persons)
+            else:
+                self.move_and_infect(self.mobile_persons)
 
             # Perform the clean up phase
             self.clean_up()
 
-            # Report simulation progress to user every 10 time steps (epochs)
-            if epoch % 10 == 0:
-                print(
-                    f'\nR naught at time step {epoch + 1}: {self.calculate_r()}')
-                print(
-                    f'---\nCalculating time steps {epoch + 1} through {epoch + 10} ...')
-
-            if epoch == 0 and self.time_steps == 0:
-                epoch += 1
-            elif self.report['infectious'][-1] == 0:
-                running = False
-                self.time_steps = epoch + 1
-            elif epoch == self.time_steps:
-                running = False
+            if checkpoint_every and self.epoch % checkpoint_every == 0:
+                self.save_checkpoint(checkpoint_path)
+
+            # Let any observers know about the progress
+            for observer in self.observers:
+                observer.on_epoch(self)
+
+            self.peak_infectious = max(self.peak_infectious,
+                                       int(self.infectious))
+
+            # Run until there are no more infectious people, the given
+            # number of time steps is reached or a stopping criterion is met
+            if self.infectious == 0:
+                self.stop_reason = 'no_infectious'
+                self.time_steps = self.epoch
+            elif self.epoch >= self.time_steps > 0:
+                self.stop_reason = 'time_steps'
             else:
-                epoch += 1
+                self.stop_reason = self.check_stopping(previous, start_time)
+
+        if self.keep_report:
+            self.report['stop_reason'] = self.stop_reason
+
+        # Make everything written so far available to readers of the sinks
+        for sink in self.sinks:
+            sink.flush()
+
+        for observer in self.observers:
+            observer.on_finish(self)
+
+    def save_checkpoint(self, path):
+        """Save the full state of the simulation, including the state of the
+        random number generator, to a NumPy .npz file. The file is written
+        under a temporary name first so a killed job never leaves a partial
+        checkpoint.
+
+        Args:
+            path (str): The path of the checkpoint file
+
+        Return:
+            None
+        """
+
+        arrays = {f'pop_{field}': getattr(self.pop, field)
+                  for field in Population.FIELDS}
+        if self.keep_report:
+            arrays.update({f'report_{key}': np.asarray(self.report[key])
+                           for key in REPORT_KEYS})
+        counters = {
+            name: int(getattr(self, name)) for name in (
+                'susceptible', 'infectious', 'recovered', 'dead',
+                'infected_total', 'infected_count', 'epoch',
+                'peak_infectious', 'steady_epochs'
+            )
+        }
+
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as checkpoint:
+            np.savez(
+                checkpoint,
+                env_params=json.dumps(self.env_params),
+                rng_state=json.dumps(self.rng.bit_generator.state),
+                counters=json.dumps(counters),
+                stop_reason=json.dumps(self.stop_reason),
+                rows=self.rows,
+                cols=self.cols,
+                **arrays
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load_checkpoint(cls, path, seed=None, env_params=None):
+        """Restore a simulation saved with save_checkpoint(). Many what-if
+        branches can be run from one checkpoint by giving each a new seed
+        and changed parameters.
+
+        Args:
+            path (str): The path of the checkpoint file
+            seed (int): If given, draw random numbers from this seed from now
+                on instead of carrying on the saved random number generator
+            env_params (dict): Parameters to change from the saved ones, eg.
+                the infection_rate. The size of the environment and
+                population can't be changed.
+
+        Return:
+            Environment: The restored simulation
+        """
+
+        with np.load(path) as checkpoint:
+            params = json.loads(str(checkpoint['env_params']))
+            params.update(env_params or {})
+            env = cls(params, seed, populate=False)
+
+            # Carry on the saved random numbers unless branching off
+            if seed is None:
+                rng_state = json.loads(str(checkpoint['rng_state']))
+                bit_generator = getattr(np.random,
+                                        rng_state['bit_generator'])()
+                bit_generator.state = rng_state
+                env.rng = np.random.Generator(bit_generator)
+
+            for name, value in json.loads(str(checkpoint['counters'])).items():
+                setattr(env, name, value)
+            env.stop_reason = json.loads(str(checkpoint['stop_reason']))
+            for field in Population.FIELDS:
+                getattr(env.pop, field)[:] = checkpoint[f'pop_{field}']
+
+            # Put the events of everyone still infectious back on the
+            # calendars
+            env.reset_schedule()
+            env.reset_index()
+            env.schedule(env.infectious_persons)
+            if env.keep_report:
+                env.report = {key: checkpoint[f'report_{key}'].tolist()
+                              for key in REPORT_KEYS}
+                if env.stop_reason is not None:
+                    env.report['stop_reason'] = env.stop_reason
+
+            # Put everyone still in the environment back in their cells
+            env.rows[:] = checkpoint['rows']
+            env.cols[:] = checkpoint['cols']
+            placed = np.flatnonzero(env.rows >= 0)
+            env.env[env.rows[placed], env.cols[placed]] = placed
+
+        if env.frames is not None:
+            env.frames.publish(env.epoch, **env.frame())
+
+        return env
+
+    def results(self):
+        """Get summary statistics of the simulation so far, see results.py.
+        The report is converted when this is called, so keep the Results
+        rather than calling this again for each statistic.
+
+        Return:
+            Results: The results of the report
+
+        Raises:
+            ValueError: If the report wasn't kept
+        """
+
+        from results import Results
+        return Results.from_env(self)
 
     def generate_plot(self, show=True, save=False):
         """Generate a plot from a simulation.
@@ -360,26 +1380,38 @@ class Environment:
 
         Return:
             None
+
+        Raises:
+            ValueError: If the report wasn't kept
         """
 
+        if not self.keep_report:
+            raise ValueError('Plotting needs the report to be kept.')
+
+        # Only import matplotlib when plotting so simulations can run without
+        # it, eg. in worker processes
+        import matplotlib.pyplot as plt
+
         # Collect the data for graphing
-        time_steps = np.array(range(self.time_steps + 1))
-        infectious = np.array(self.report['infectious'])
-        recovered = np.array(self.report['recovered'])
-        dead = np.array(self.report['dead'])
-        not_infected = np.array(self.report['not_infected'])
+        results = self.results()
+        time_steps = np.arange(len(results))
+        final = results.final_sizes
 
         # Plot the data
         plt.figure(figsize=(7,7))
         infectious, = plt.plot(
-            time_steps, infectious, label=str(
-                f'Infectious (end: {infectious[-1]} | max: {max(infectious)})'
+            time_steps, results['infectious'], label=str(
+                f'Infectious (end: {final["infectious"]} | '
+                f'max: {results.peak_infectious})'
             ))
         recovered, = plt.plot(
-            time_steps, recovered, label=f'Recovered (end: {recovered[-1]})')
-        dead, = plt.plot(time_steps, dead, label=f'Deceased (end: {dead[-1]})')
+            time_steps, results['recovered'],
+            label=f'Recovered (end: {final["recovered"]})')
+        dead, = plt.plot(time_steps, results['dead'],
+                         label=f'Deceased (end: {final["dead"]})')
         not_infected, = plt.plot(
-            time_steps, not_infected, label=f'Not infected (end: {not_infected[-1]})'
+            time_steps, results['not_infected'],
+            label=f'Not infected (end: {final["not_infected"]})'
         )
 
         # Plot description
@@ -391,7 +1423,7 @@ class Environment:
             f'Infection rate: {self.infection_rate * 100:.0f}%\n'
             f'Mortality rate: {self.mortality_rate * 100:.0f}%\n'
             f'Asymptomatic rate: {self.asymptomatic_prob * 100:.0f}%\n'
-            f'Time steps: {self.time_steps}'
+            f'Time steps: {self.epoch}'
         )
 
         # Set graph title, axis, and legend
@@ -422,23 +1454,101 @@ class Environment:
         )
 
 
-class Person:
-    """A class for creating people to populate the Environment class with.
+class Population:
+    """A structure of arrays holding the state of every person in an
+    Environment. Person n is found at index n of each array.
     """
 
-    def __init__(self, recovery_mean,
-                 recovery_sd, asymptomatic_prob):
-        self.infected = False
-        self.recovered = False
-        self.alive = True
-        self.interaction_rate = 0
-        self.days_infected = 0
-        self.has_infected = 0  # For calculating R naught value of virus
-        self.days_to_recover = round(np.random.normal(
-            recovery_mean, recovery_sd
-        ))
+    # The arrays holding the state of the population
+    FIELDS = ('state', 'infected_at', 'days_to_recover', 'interaction_rate',
+              'asymptomatic', 'has_infected')
+
+    def __init__(self, size, recovery_mean, recovery_sd, asymptomatic_prob,
+                 rng):
+        self.state = np.full(size, SUSCEPTIBLE, dtype=np.uint8)
+        # The time step each person was infected in, -1 if never
+        self.infected_at = np.full(size, -1, dtype=np.int32)
+        # Everyone takes at least a day to recover
+        self.days_to_recover = np.maximum(np.round(rng.normal(
+            recovery_mean, recovery_sd, size
+        )), 1).astype(np.int16)
+        self.interaction_rate = np.zeros(size, dtype=np.int16)
+        self.asymptomatic = rng.random(size) <= asymptomatic_prob
+        self.has_infected = np.zeros(size, dtype=np.int32)  # For R naught
+
+    def __len__(self):
+        return self.state.size
+
+    def __getitem__(self, person):
+        return Person(self, int(person))
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def keys(self):
+        """Return the people in the population, as a dict of people would.
+        """
+        return range(len(self))
 
-        if random() <= asymptomatic_prob:
-            self.asymptomatic = True
-        else:
-            self.asymptomatic = False
+
+def _person_field(name):
+    """Create a property reading and writing a Population array for the
+    person a Person view points at.
+    """
+
+    def getter(self):
+        return getattr(self.population, name)[self.index].item()
+
+    def setter(self, value):
+        getattr(self.population, name)[self.index] = value
+
+    return property(getter, setter)
+
+
+class Person:
+    """A view of a single person in a Population, kept for code that works
+    with one person at a time.
+
+    The days_infected counter of earlier versions is no longer kept, as
+    infections are scheduled from the time step they started in. Use
+    env.epoch - person.infected_at instead, which is the same while the
+    person is infected.
+    """
+
+    infected_at = _person_field('infected_at')
+    days_to_recover = _person_field('days_to_recover')
+    interaction_rate = _person_field('interaction_rate')
+    asymptomatic = _person_field('asymptomatic')
+    has_infected = _person_field('has_infected')
+
+    def __init__(self, population, index):
+        self.population = population
+        self.index = index
+
+    @property
+    def infected(self):
+        # The dead remain infected as they never recovered
+        return self.population.state[self.index] in (INFECTIOUS, DEAD)
+
+    @infected.setter
+    def infected(self, value):
+        if value and self.population.state[self.index] == SUSCEPTIBLE:
+            self.population.state[self.index] = INFECTIOUS
+
+    @property
+    def recovered(self):
+        return self.population.state[self.index] == RECOVERED
+
+    @recovered.setter
+    def recovered(self, value):
+        if value:
+            self.population.state[self.index] = RECOVERED
+
+    @property
+    def alive(self):
+        return self.population.state[self.index] != DEAD
+
+    @alive.setter
+    def alive(self, value):
+        if not value:
+            self.population.state[self.index] = DEAD
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""Compiled kernels for the move, infect and clean up phases of a time step,
+used by an Environment with the 'backend' parameter set to 'numba'.
+
+Each kernel does exactly what the NumPy code in infect_sim.py does, drawing
+the same random numbers from the same Generator in the same order, so a
+simulation gives the same results with either backend. Run this module to
+check that they do.
+
+Numba is optional. Without it HAVE_NUMBA is False and Environment falls back
+to the NumPy backend.
+"""
+
+import argparse
+import sys
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from infect_sim import SUSCEPTIBLE, INFECTIOUS, RECOVERED, DEAD, EMPTY
+
+HAVE_NUMBA = numba is not None
+
+# The starting size of the array of people infected in a call, which grows
+# as needed rather than being sized for the whole population
+INFECTED_SIZE = 64
+
+
+def _jit(function):
+    """Compile a function with Numba, caching it on disk, or leave it as
+    plain Python if Numba isn't installed.
+    """
+
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+@_jit
+def _infect(cells, rows, cols, state, rates, has_infected, person,
+            table_starts, table_rows, table_cols, infection_rate, rng,
+            infected, count):
+    """See if an infectious person infects others, see
+    Environment.infect(), adding those infected to the infected array after
+    the first count.
+
+    Return:
+        tuple: The infected array, grown if it was too small, and the number
+            of people in it
+    """
+
+    radius = rates[person]
+    if radius <= 0:
+        return infected, count
+
+    env_dim = cells.shape[0]
+    start, stop = table_starts[radius], table_starts[radius + 1]
+    row, col = rows[person], cols[person]
+
+    # The cells of the disc surrounding the subject. A disc wider than the
+    # environment wraps onto itself so only keep each cell once.
+    flat = np.empty(stop - start, dtype=np.int64)
+    for i in range(start, stop):
+        flat[i - start] = (((row + table_rows[i]) % env_dim) * env_dim
+                           + (col + table_cols[i]) % env_dim)
+    if 2 * radius + 1 > env_dim:
+        flat = np.unique(flat)
+
+    # Find everyone not already infected before any of them become infected
+    candidates = np.empty(flat.size, dtype=np.int64)
+    candidates_count = 0
+    for cell in flat:
+        occupant = cells[cell // env_dim, cell % env_dim]
+        if occupant != EMPTY and state[occupant] == SUSCEPTIBLE:
+            candidates[candidates_count] = occupant
+            candidates_count += 1
+
+    # Make room for every candidate, doubling the array so it is only
+    # copied a few times however many people are infected
+    if count + candidates_count > infected.size:
+        grown = np.empty(max(2 * infected.size, count + candidates_count),
+                         dtype=np.int64)
+        grown[:count] = infected[:count]
+        infected = grown
+
+    # See if these people become infected
+    start = count
+    for i in range(candidates_count):
+        if rng.random() <= infection_rate:
+            state[candidates[i]] = INFECTIOUS
+            infected[count] = candidates[i]
+            count += 1
+    has_infected[person] += count - start
+
+    return infected, count
+
+
+@_jit
+def move_and_infect(cells, rows, cols, state, rates, has_infected, persons,
+                    orders, directions, table_starts, table_rows, table_cols,
+                    infection_rate, rng):
+    """Move each given person in turn, see Environment.move(), and have the
+    infectious ones try to infect those around them straight after moving.
+
+    Return:
+        array: The people infected
+    """
+
+    env_dim = cells.shape[0]
+    infected = np.empty(INFECTED_SIZE, dtype=np.int64)
+    count = 0
+    for i in range(persons.size):
+        person = persons[i]
+        row, col = rows[person], cols[person]
+
+        # Try each direction in turn until one leads to an empty cell
+        for direction in orders[i]:
+            new_row = (row + directions[direction, 0]) % env_dim
+            new_col = (col + directions[direction, 1]) % env_dim
+            if cells[new_row, new_col] == EMPTY:
+                cells[new_row, new_col] = person
+                cells[row, col] = EMPTY
+                rows[person], cols[person] = new_row, new_col
+                break
+
+        if state[person] == INFECTIOUS:
+            infected, count = _infect(
+                cells, rows, cols, state, rates, has_infected, person,
+                table_starts, table_rows, table_cols, infection_rate, rng,
+                infected, count)
+
+    return infected[:count]
+
+
+@_jit
+def infect_all(cells, rows, cols, state, rates, has_infected, persons,
+               table_starts, table_rows, table_cols, infection_rate, rng):
+    """Have each given infectious person in turn try to infect those around
+    them.
+
+    Return:
+        array: The people infected
+    """
+
+    infected = np.empty(INFECTED_SIZE, dtype=np.int64)
+    count = 0
+    for person in persons:
+        infected, count = _infect(
+            cells, rows, cols, state, rates, has_infected, person,
+            table_starts, table_rows, table_cols, infection_rate, rng,
+            infected, count)
+    return infected[:count]
+
+
+@_jit
+def clean_up(cells, rows, cols, state, rates, asymptomatic, has_infected,
+             turning, resolved, interaction_rate, mortality_rate,
+             remove_persons, rng):
+    """Advance the infection of the people with an event this time step,
+    see Environment.clean_up().
+
+    Return:
+        tuple: The number of people who died, the number who recovered and
+            the sum of has_infected over both
+    """
+
+    # Newly infectious people get their interaction rate
+    for person in turning:
+        draw = rng.normal()
+        if asymptomatic[person]:
+            rate = interaction_rate + 0.5 * interaction_rate * draw
+        else:
+            rate = 0.75 + 0.25 * draw
+        rates[person] = np.round(rate)
+
+    # See if those at the end of their infection die or recover
+    dead = recovered = infected_total = 0
+    for person in resolved:
+        if rng.random() <= mortality_rate:
+            state[person] = DEAD
+            dead += 1
+        else:
+            state[person] = RECOVERED
+            recovered += 1
+        infected_total += has_infected[person]
+
+        if remove_persons:
+            cells[rows[person], cols[person]] = EMPTY
+            rows[person] = cols[person] = -1
+
+    return dead, recovered, infected_total
+
+
+def check_equivalence(env_params, seed=0, epochs=50):
+    """Run a simulation with the NumPy and the Numba backends from the same
+    seed and check they stay identical.
+
+    Args:
+        env_params (dict): The environment parameters
+        seed (int): The seed of both simulations
+        epochs (int): The number of time steps to compare
+
+    Return:
+        list: A description of each difference, empty if there are none
+    """
+
+    import infect_sim as infect
+
+    params = dict(env_params, time_steps=epochs)
+    envs = [infect.Environment(dict(params, backend=backend), seed)
+            for backend in infect.BACKENDS]
+    for env in envs:
+        env.run_sim()
+
+    numpy_env, numba_env = envs
+    differences = []
+    for key in infect.REPORT_KEYS:
+        if numpy_env.report[key] != numba_env.report[key]:
+            differences.append(f'report {key}')
+    arrays = {'grid': lambda env: env.env.cells,
+              'rows': lambda env: env.rows,
+              'cols': lambda env: env.cols,
+              **{field: lambda env, field=field: getattr(env.pop, field)
+                 for field in infect.Population.FIELDS}}
+    for name, array in arrays.items():
+        if not np.array_equal(array(numpy_env), array(numba_env)):
+            differences.append(name)
+    if not np.array_equal(numpy_env.rng.random(4), numba_env.rng.random(4)):
+        differences.append('random state')
+
+    return differences
+
+
+def main():
+    """Check the Numba backend against the NumPy backend for a few
+    configurations, exiting with a status of 1 if any differ.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--epochs', type=int, default=50,
+                        help='time steps to compare per configuration')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of every configuration')
+    args = parser.parse_args()
+
+    if not HAVE_NUMBA:
+        sys.exit('Numba is not installed.')
+
+    env_params = {
+        'env_dim': 100,
+        'pop_size': 2000,
+        'initially_infected': 10,
+        'interaction_rate': 4,
+        'infection_rate': .4,
+        'mortality_rate': .02,
+        'recovery_mean': 19,
+        'recovery_sd': 3,
+        'asymptomatic_prob': 0.25,
+        'days_until_infectious': 2
+    }
+    configs = {
+        'sequential': {},
+        'synchronous': {'move_mode': 'synchronous'},
+        'crowded': {'env_dim': 50, 'pop_size': 2000},
+        # Discs wider than the environment wrap onto themselves
+        'small': {'env_dim': 7, 'pop_size': 30, 'interaction_rate': 5}
+    }
+
+    failed = False
+    for name, config in configs.items():
+        differences = check_equivalence(dict(env_params, **config),
+                                        args.seed, args.epochs)
+        print(f'{name}: {", ".join(differences) or "identical"}')
+        failed = failed or bool(differences)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
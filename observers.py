@@ -0,0 +1,72 @@
+"""Observers that are notified as a simulation runs. Attach them with
+Environment.add_observer().
+"""
+
+import sys
+from time import perf_counter
+
+
+class Observer:
+    """Base class for observers. Override any of the hooks, which do nothing
+    by default.
+    """
+
+    def on_start(self, env):
+        """Called when run_sim() starts or resumes.
+
+        Args:
+            env (Environment): The simulation
+        """
+
+    def on_epoch(self, env):
+        """Called after each time step of run_sim().
+
+        Args:
+            env (Environment): The simulation
+        """
+
+    def on_finish(self, env):
+        """Called when run_sim() finishes.
+
+        Args:
+            env (Environment): The simulation
+        """
+
+
+class ProgressReporter(Observer):
+    """Report the progress of a simulation at most once per interval with its
+    speed in epochs and agents per second and, when the number of time steps
+    is fixed, an estimate of the time left.
+    """
+
+    def __init__(self, interval=1.0, stream=None):
+        self.interval = interval
+        self.stream = stream if stream is not None else sys.stderr
+        self.start_time = self.last_time = None
+        self.start_epoch = 0
+
+    def on_start(self, env):
+        self.start_time = self.last_time = perf_counter()
+        self.start_epoch = env.epoch
+
+    def on_epoch(self, env):
+        now = perf_counter()
+        if now - self.last_time < self.interval:
+            return
+        self.last_time = now
+
+        epochs_per_sec = (env.epoch - self.start_epoch) / (now - self.start_time)
+        if env.time_steps > 0:
+            eta = f'{(env.time_steps - env.epoch) / epochs_per_sec:.0f}s'
+        else:
+            eta = 'until no one is infectious'
+        print(f'Time step {env.epoch}: {env.infectious} infectious, '
+              f'R naught {env.calculate_r()} | '
+              f'{epochs_per_sec:.1f} epochs/s, '
+              f'{epochs_per_sec * env.pop_size:.0f} agents/s, ETA {eta}',
+              file=self.stream)
+
+    def on_finish(self, env):
+        run_time = perf_counter() - self.start_time
+        print(f'Finished {env.epoch} time steps in {run_time:.2f}s '
+              f'({env.stop_reason})', file=self.stream)
@@ -0,0 +1,248 @@
+"""Step a single large environment on several cores by splitting its grid
+into horizontal strips that are moved and infected in parallel by worker
+processes over shared memory. Attach a Partition to an Environment and
+run_sim() uses it for the move and infect phases:
+
+    with partition.Partition(env, workers=8) as part:
+        env.run_sim()
+
+The clean up phase still runs in the main process, on the same shared
+arrays.
+
+Strips and halos: the grid is split into an even number of strips of rows.
+Moving a person and infecting those around them touches at most
+max_radius + 1 rows beyond the strip the person started in, the halo rows of
+the neighbouring strips. Every strip is at least twice that high, so
+the even numbered strips step in parallel without touching each other's
+rows, followed by the odd numbered strips. Workers read and write their
+halo rows directly in the shared grid, which is safe as the neighbours
+owning them are idle during that phase. Having an even number of strips
+keeps the first and last strips, which are neighbours across the wrap
+around of the environment, in different phases.
+
+Handing over agents: each strip moves the people who were in it at the
+start of the time step, in order of ID. Someone who steps across a border
+lands in a halo row of the neighbouring strip and belongs to that strip
+from the next time step, so no one moves twice in a time step.
+
+Infections across borders: an infected person in a halo row is marked
+infectious straight away in the shared state. Each worker returns the
+people it infected for the main process to schedule and count.
+
+Every (time step, strip) has its own random numbers spawned from one seed
+drawn from the environment's Generator, so a simulation is reproducible
+from its seed for a given number of strips whatever the number of workers.
+It differs from a single process simulation, which moves everyone in one
+order.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import infect_sim as infect
+import kernels
+from shared import SharedArrays
+
+# The arrays the workers read and write, see Partition.share()
+SHARED_FIELDS = ('state', 'interaction_rate', 'has_infected')
+
+# The worker process's view of the shared simulation, see _init_worker()
+_worker = None
+
+
+def _init_worker(spec, max_radius, infection_rate, entropy):
+    """Map the shared arrays of the simulation into a worker process.
+
+    Args:
+        spec (dict): The spec of the shared arrays
+        max_radius (int): The largest interaction radius
+        infection_rate (float): The chance of infecting each person in reach
+        entropy (int): The seed of the random numbers of every strip
+    """
+
+    global _worker
+    _worker = {
+        'arrays': SharedArrays.attach(spec),
+        'table': infect.disc_table(max_radius),
+        'infection_rate': infection_rate,
+        'entropy': entropy
+    }
+
+
+def _step_strip(epoch, strip, start, stop):
+    """Move the people of a strip in turn, each infectious one trying to
+    infect those around them straight after moving.
+
+    Args:
+        epoch (int): The time step being run
+        strip (int): The strip being stepped
+        start (int): The start of the strip's people in the persons array
+        stop (int): The end of the strip's people in the persons array
+
+    Return:
+        array: The people infected
+    """
+
+    arrays = _worker['arrays']
+    persons = arrays['persons'][start:stop]
+    rng = np.random.default_rng(np.random.SeedSequence(
+        _worker['entropy'], spawn_key=(epoch, strip)))
+    orders = rng.permuted(
+        np.tile(np.arange(len(infect.DIRECTIONS), dtype=np.int8),
+                (len(persons), 1)), axis=1)
+
+    return kernels.move_and_infect(
+        arrays['cells'], arrays['rows'], arrays['cols'], arrays['state'],
+        arrays['interaction_rate'], arrays['has_infected'], persons, orders,
+        infect.DIRECTIONS, *_worker['table'], _worker['infection_rate'], rng)
+
+
+class Partition:
+    """Multi-core stepping of an Environment split into strips of rows.
+
+    Interaction rates are capped at max_radius while the partition is
+    attached, as that sets the height of the halos.
+
+    Args:
+        env (Environment): The simulation, with the dense grid and sequential
+            move mode
+        strips (int): The number of strips, even and at least 2. By default
+            two per worker, as many as fit.
+        workers (int): The number of worker processes, by default one per
+            core
+        max_radius (int): The largest interaction radius, by default three
+            times the mean interaction rate
+
+    Raises:
+        ValueError: If the simulation or strips are unsuitable
+    """
+
+    def __init__(self, env, strips=None, workers=None, max_radius=None):
+        if env.grid != 'dense':
+            raise ValueError('Partitioning needs the dense grid.')
+        if env.move_mode != 'sequential':
+            raise ValueError('Partitioning needs the sequential move mode.')
+
+        if workers is None:
+            workers = os.cpu_count()
+        if max_radius is None:
+            max_radius = int(3 * env.interaction_rate)
+        # Strips must be at least twice the reach of a time step high
+        halo = max_radius + 1
+        if strips is None:
+            strips = min(2 * workers, env.env_dim // (2 * halo))
+            strips -= strips % 2
+            if strips < 2:
+                raise ValueError(
+                    f'Strips of an environment {env.env_dim} rows high are '
+                    f'too thin for an interaction radius of {max_radius}, '
+                    f'which needs at least {4 * halo} rows.')
+        if strips < 2 or strips % 2:
+            raise ValueError(f'Strips must be even and at least 2, got '
+                             f'{strips}.')
+        if env.env_dim // strips < 2 * halo:
+            raise ValueError(f'{strips} strips are too thin for an '
+                             f'interaction radius of {max_radius}.')
+
+        self.env = env
+        self.strips = strips
+        self.max_radius = max_radius
+        # The first row of each strip, and the end of the last
+        self.bounds = np.linspace(0, env.env_dim, strips + 1).astype(int)
+
+        self.arrays = self.share()
+        spec = self.arrays.spec
+        if env.shared is not None:
+            spec.update(env.shared.spec)
+        self.pool = ProcessPoolExecutor(
+            workers, initializer=_init_worker,
+            initargs=(spec, max_radius, env.infection_rate,
+                      int(env.rng.integers(2 ** 63))))
+        env.partition = self
+
+    def share(self):
+        """Move the arrays the workers need into shared memory, pointing the
+        simulation at the shared copies. A simulation already in shared
+        memory, see Environment.share_memory(), is used as it is.
+
+        Return:
+            SharedArrays: The shared arrays
+        """
+
+        env = self.env
+        # The people to move, grouped by strip
+        persons = np.zeros(env.pop_size, dtype=np.int64)
+        if env.shared is not None:
+            return SharedArrays.create({'persons': persons})
+
+        arrays = SharedArrays.create({
+            'cells': env.env.cells,
+            'rows': env.rows,
+            'cols': env.cols,
+            **{field: getattr(env.pop, field) for field in SHARED_FIELDS},
+            'persons': persons
+        })
+
+        env.env.cells = arrays['cells']
+        env.rows, env.cols = arrays['rows'], arrays['cols']
+        for field in SHARED_FIELDS:
+            setattr(env.pop, field, arrays[field])
+
+        return arrays
+
+    def step(self, persons):
+        """Move the given people, with the infectious ones trying to infect
+        those around them, one phase of strips at a time.
+
+        Args:
+            persons (array): The people who are moving
+
+        Return:
+            None
+        """
+
+        env = self.env
+
+        # Group the people by the strip they start the time step in, keeping
+        # them in order of ID within each strip
+        strip_of = np.searchsorted(self.bounds, env.rows[persons],
+                                   side='right') - 1
+        order = np.argsort(strip_of, kind='stable')
+        self.arrays['persons'][:persons.size] = persons[order]
+        offsets = np.searchsorted(strip_of[order], np.arange(self.strips + 1))
+
+        # Cap the interaction rates of the newly infectious
+        np.minimum(env.pop.interaction_rate, self.max_radius,
+                   out=env.pop.interaction_rate)
+
+        for phase in (0, 1):
+            futures = [self.pool.submit(_step_strip, env.epoch, strip,
+                                        offsets[strip], offsets[strip + 1])
+                       for strip in range(phase, self.strips, 2)]
+            for future in futures:
+                infected = future.result()
+                env.new_infections.append(infected)
+                env.susceptible -= infected.size
+                env.infectious += infected.size
+
+    def close(self):
+        """Stop the workers and detach from the simulation, copying its
+        arrays back out of shared memory, unless they were already shared,
+        so it can carry on without the partition.
+        """
+
+        self.pool.shutdown()
+        env = self.env
+        if 'cells' in self.arrays:
+            env.env.cells = env.env.cells.copy()
+            env.rows, env.cols = env.rows.copy(), env.cols.copy()
+            for field in SHARED_FIELDS:
+                setattr(env.pop, field, getattr(env.pop, field).copy())
+        env.partition = None
+        self.arrays.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,149 @@
+"""Optional instrumentation recording where the time of a simulation goes.
+
+Attach a Profile to an Environment's profile attribute and run_sim(),
+clean_up() and pygame_sim.step_sim() record the time, calls and, if asked,
+the memory allocated by each phase of each time step. Times are inclusive,
+eg. the calculate_r phase is part of the save_stats phase, which follows
+the clean_up phase rather than being part of it. With no Profile attached
+the instrumentation costs a single check per phase.
+"""
+
+import json
+import tracemalloc
+from collections import defaultdict
+from time import perf_counter
+
+
+class Profile:
+    """Cumulative and per time step time, call counts and allocations of each
+    phase of a simulation.
+
+    Args:
+        allocations (bool): Record the net bytes allocated by each phase with
+            tracemalloc, which slows the simulation down a lot
+        trace (bool): Record every phase call for write_chrome_trace()
+    """
+
+    def __init__(self, allocations=False, trace=False):
+        self.allocations = allocations
+        self.trace = trace
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.allocated = defaultdict(int)
+        self.epochs = []  # The above for each time step
+        self.stacks = defaultdict(float)  # Exclusive time of each call stack
+        self.events = []  # Every phase call when tracing
+
+        self._stack = []
+        self._epoch_start = self._snapshot()
+        self._origin = perf_counter()
+
+    def start(self, phase):
+        """Start timing a phase. Phases can be nested.
+
+        Args:
+            phase (str): The name of the phase
+        """
+
+        memory = tracemalloc.get_traced_memory()[0] if self.allocations else 0
+        # Name, start time, time spent in nested phases, memory at start
+        self._stack.append([phase, perf_counter(), 0.0, memory])
+
+    def stop(self):
+        """Stop timing the most recently started phase.
+        """
+
+        now = perf_counter()
+        phase, start, nested, memory = self._stack.pop()
+        duration = now - start
+
+        self.times[phase] += duration
+        self.calls[phase] += 1
+        if self.allocations:
+            self.allocated[phase] += tracemalloc.get_traced_memory()[0] - memory
+
+        stack = ';'.join([frame[0] for frame in self._stack] + [phase])
+        self.stacks[stack] += duration - nested
+        if self._stack:
+            self._stack[-1][2] += duration
+
+        if self.trace:
+            self.events.append((phase, start - self._origin, duration))
+
+    def end_epoch(self, epoch):
+        """Record what each phase did during a time step.
+
+        Args:
+            epoch (int): The time step that just ended
+        """
+
+        snapshot = self._snapshot()
+        self.epochs.append({
+            'epoch': epoch,
+            **{key: {phase: value - self._epoch_start[key].get(phase, 0)
+                     for phase, value in totals.items()}
+               for key, totals in snapshot.items()}
+        })
+        self._epoch_start = snapshot
+
+    def _snapshot(self):
+        """Copy the cumulative totals.
+        """
+        return {'times': dict(self.times),
+                'calls': dict(self.calls),
+                'allocated': dict(self.allocated)}
+
+    def summary(self):
+        """Get the cumulative totals of each phase.
+
+        Return:
+            dict: The time in seconds, calls and allocated bytes of each phase
+        """
+
+        return {phase: {'time': self.times[phase],
+                        'calls': self.calls[phase],
+                        'allocated': self.allocated[phase]}
+                for phase in self.times}
+
+    def write_folded(self, path):
+        """Write the exclusive time of each call stack in microseconds in the
+        folded format read by flamegraph.pl and speedscope.
+
+        Args:
+            path (str): The path of the file
+        """
+
+        with open(path, 'w') as folded:
+            for stack, seconds in self.stacks.items():
+                folded.write(f'{stack} {round(seconds * 1e6)}\n')
+
+    def write_chrome_trace(self, path):
+        """Write every phase call in the Chrome trace event format read by
+        chrome://tracing and Perfetto. Needs a Profile made with trace=True.
+
+        Args:
+            path (str): The path of the file
+
+        Raises:
+            ValueError: If phase calls weren't recorded
+        """
+
+        if not self.trace:
+            raise ValueError('Chrome traces need a Profile with trace=True.')
+
+        with open(path, 'w') as trace:
+            json.dump({'traceEvents': [
+                {'name': phase, 'ph': 'X', 'pid': 0, 'tid': 0,
+                 'ts': start * 1e6, 'dur': duration * 1e6}
+                for phase, start, duration in self.events
+            ]}, trace)
+
+    def close(self):
+        """Stop tracing allocations.
+        """
+
+        if self.allocations:
+            tracemalloc.stop()
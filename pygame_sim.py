@@ -4,23 +4,34 @@ people living relatively close and with a high rate of interaction. The
 simulation is run until there are no more infectious people.
 """
 
+import argparse
+import json
 import sys
 from time import perf_counter
 import pygame
 import numpy as np
 import infect_sim as infect
+from render import FrameWriter, Renderer, render
+from shared import Frames
+
+# Define some visualization constants
+TIME_DELAY = 250  # Milliseconds
 
 
 def step_sim(sim):
-    # Move the simulation one time step forward
-    for person in sim.pop.keys():
-        if sim.pop[person].alive:
-            sim.move(person)
-            conditions = [
-                sim.pop[person].infected, sim.pop[person].recovered
-            ]
-            if conditions == [True, False]:  # Person is infectious
-                sim.infect(person)
+    # Move the simulation one time step forward, timing each phase if the
+    # simulation is being profiled. Recovered people stay in the environment
+    # and keep moving.
+    mobile = np.flatnonzero(sim.pop.state != infect.DEAD)
+    if sim.move_mode == 'synchronous':
+        if sim.profile is not None:
+            sim.profile.start('move')
+        sim.move_all(mobile)
+        if sim.profile is not None:
+            sim.profile.stop()
+        sim.infect_all(sim.infectious_persons)
+    else:
+        sim.move_and_infect(mobile)
 
     # Perform the clean up phase
     sim.clean_up(remove_persons=False)
@@ -29,110 +40,38 @@ def step_sim(sim):
     sim.time_steps += 1
 
 
-def run_viz(env_params):
+def run_viz(env_params, output=None):
     """Set up and run the simulation until there are no more infectious people.
+
+    Args:
+        env_params (dict): The environment parameters
+        output (str): If given, run headless without a window as fast as
+            possible, writing each frame to this GIF file or PNG file
+            pattern, see render.FrameWriter
     """
 
     # Environment parameters that are used elsewhere for the visualization
     env_dim = env_params['env_dim']
-    pop_size = env_params['pop_size']
-    initially_infected = env_params['initially_infected']
-    interaction_rate = env_params['interaction_rate']
 
     # Instantiate the simulation environment
     sim = infect.Environment(env_params)
+    renderer = Renderer(env_dim)
+
+    if output is not None:
+        run_headless(sim, renderer, output)
+        return
 
     # PYGAME VISUALIZATION
     pygame.init()
-
-    # Define some visualization constants
-    TIME_DELAY = 250  # Milliseconds
-    CELL = 6
-    MARGIN = 1
-    SCREEN_DIM = env_dim * CELL + (MARGIN * env_dim + 1)
-
-    # RGB Colors
-    BLACK = (0, 0, 0)
-    WHITE = (255, 255, 255)
-    RED = (255, 0, 0)
-    GREEN = (0, 255, 0)
-    OLIVE = (75, 150, 0)
-    BLUE = (0, 0, 255)
-
-    # Define screen size based on the env_dim, the cell size of the grid, and
-    # they margin size between cells
-    screen = pygame.display.set_mode((SCREEN_DIM, SCREEN_DIM))
+    screen = pygame.display.set_mode((renderer.size, renderer.size))
 
     running = True
     while running:
         start_time_step = perf_counter()
 
         # Draw the current environment state
-        screen.fill(BLACK)
-
-        # Get a tuple object consisting of each coordinate in the environment
-        # that is part of a "mask" that represents the interaction rate of each
-        # infected person
-        mask_indices_set = []
-        for row, col in np.ndindex(sim.env.shape):
-            pygame.draw.rect(screen, WHITE,
-                             [(MARGIN + CELL) * col + MARGIN,
-                              (MARGIN + CELL) * row + MARGIN,
-                              CELL,
-                              CELL])
-            if sim.env[row, col] != np.Inf:  # Cell is occupied by a person
-                person = sim.env[row, col]
-                r = sim.pop[person].interaction_rate
-                infectious = [sim.pop[person].alive,
-                              sim.pop[person].infected,
-                              sim.pop[person].recovered]
-
-                # If the person is infectious then get environment indices of
-                # their mask
-                if infectious == [True, True, False]:
-                    y, x = np.ogrid[-col: env_dim - col, -row: env_dim - row]
-                    mask = x*x + y*y <= r*r
-                    mask_indices = np.where(mask == True)
-                    mask_indices = [tuple(mask) for mask in mask_indices]
-                    x_coordinates = mask_indices[1]
-                    y_coordinates = mask_indices[0]
-
-                    # Add their mask indices to the master list
-                    for x, y in zip(x_coordinates, y_coordinates):
-                        mask_indices_set.append((x, y))
-
-        # Draw in the masks
-        for coordinate in mask_indices_set:
-            row, col = coordinate[0], coordinate[1]
-            pygame.draw.rect(screen, OLIVE,
-                             [(MARGIN + CELL) * col + MARGIN,
-                              (MARGIN + CELL) * row + MARGIN,
-                              CELL,
-                              CELL])
-
-        # Draw in the people
-        for row, col in np.ndindex(sim.env.shape):
-            if sim.env[row, col] != np.Inf:  # Cell is occupied by a person
-                person = sim.env[row, col]
-                infectious = [sim.pop[person].alive,
-                              sim.pop[person].infected,
-                              sim.pop[person].recovered]
-                # Change the color of the cell depending on the person's state
-                if infectious == [True, True, False]:
-                    color = GREEN
-                elif sim.pop[person].recovered:
-                    color = BLUE
-                elif not sim.pop[person].alive:
-                    color = RED
-                else:
-                    color = BLACK  # Unaffected
-
-                # Fill in the cell's color
-                pygame.draw.rect(screen, color,
-                                 [(MARGIN + CELL) * col + MARGIN,
-                                  (MARGIN + CELL) * row + MARGIN,
-                                  CELL,
-                                  CELL])
+        renderer.draw(screen, render(sim.rows, sim.cols, sim.pop.state,
+                                     sim.pop.interaction_rate, env_dim))
 
         step_sim(sim)
 
@@ -145,7 +84,7 @@ def run_viz(env_params):
         pygame.display.flip()
 
         # Simulation is over when there are no more infectious persons
-        if sim.report['infectious'][-1] == 0:
+        if sim.infectious == 0:
             sim.generate_plot()  # Show summary stats
             running = False
 
@@ -156,7 +95,98 @@ def run_viz(env_params):
             sys.exit()
 
 
+def run_headless(sim, renderer, output):
+    """Run the simulation until there are no more infectious people, writing
+    each frame to files instead of a window.
+
+    Args:
+        sim (Environment): The simulation
+        renderer (Renderer): Draws the frames
+        output (str): The GIF file or PNG file pattern to write
+    """
+
+    surface = renderer.surface()
+    with FrameWriter(output, TIME_DELAY) as writer:
+        running = True
+        while running:
+            renderer.draw(surface, render(sim.rows, sim.cols, sim.pop.state,
+                                          sim.pop.interaction_rate,
+                                          sim.env_dim))
+            writer.write(surface, sim.epoch)
+
+            step_sim(sim)
+
+            # Simulation is over when there are no more infectious persons
+            running = sim.infectious > 0
+
+
+def watch(spec):
+    """Draw the frames published by a simulation running in another process
+    with shared memory, see Environment.share_memory(), until there are no
+    more infectious people. The simulation runs at full speed while this
+    samples its latest frame once per TIME_DELAY.
+
+    Args:
+        spec (dict): The spec of the simulation's shared memory, see
+            Environment.shared_spec()
+    """
+
+    frames = Frames.attach(spec['frames'])
+
+    pygame.init()
+    screen = renderer = None
+    epoch = -1
+
+    running = True
+    while running:
+        start_time_step = perf_counter()
+
+        # Render the latest frame straight from shared memory, only showing
+        # it if it wasn't overwritten while being rendered
+        frame = frames.latest()
+        if frame is not None and frame['epoch'] != epoch:
+            if screen is None:
+                renderer = Renderer(spec['env_params']['env_dim'])
+                screen = pygame.display.set_mode((renderer.size,
+                                                  renderer.size))
+            renderer.draw(screen, render(
+                frame['rows'], frame['cols'], frame['state'],
+                frame['interaction_rate'], renderer.env_dim))
+            if frames.valid(frame):
+                pygame.display.flip()
+                epoch = frame['epoch']
+                # Simulation is over when there are no more infectious
+                # persons
+                running = frame['counts'][infect.INFECTIOUS] > 0
+
+        run_time = (perf_counter() - start_time_step) * 1000  # Milliseconds
+        if run_time < TIME_DELAY:
+            pygame.time.delay(int(TIME_DELAY - run_time))
+
+        for evt in pygame.event.get():
+            if evt.type == pygame.QUIT:
+                running = False
+
+    frames.close()
+    pygame.quit()
+
+
 def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--watch', default=None, metavar='SPEC',
+                        help='draw a simulation running in another process '
+                             'from the JSON spec of its shared memory')
+    parser.add_argument('-o', '--output', default=None,
+                        help='run without a window, writing the frames to '
+                             'this GIF file or PNG file pattern, eg. '
+                             'frames/{epoch:05d}.png')
+    args = parser.parse_args()
+
+    if args.watch is not None:
+        with open(args.watch) as spec_file:
+            watch(json.load(spec_file))
+        return
+
     # Load environment parameters into a dict
     env_params = {
         'time_steps': 0,  # Run the sim until there are no infectious people
@@ -167,12 +197,12 @@ def main():
         'infection_rate': .4,  # Percent likelihood of spreading the disease
         'mortality_rate': .02,  # Percent likelihood of dieing from the disease
         'recovery_mean': 19,  # Mean number of days it takes to recover
-        'death_sd': 4,  # Standard deviation of days it takes to die
+        'recovery_sd': 3,  # Standard deviation of days it takes to recover
         'asymptomatic_prob': 0.25,  # Probability of being asymptomatic
-        'days_unitl_infectious': 2
+        'days_until_infectious': 2
     }
 
-    run_viz(env_params)
+    run_viz(env_params, args.output)
 
 
 if __name__ == '__main__':
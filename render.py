@@ -0,0 +1,176 @@
+"""Fast rendering of an environment for pygame_sim.py. Each frame is built as
+an RGB array with one pixel per cell in a single vectorised pass, then
+scaled up and blitted to a PyGame surface at once. Frames can also be
+written to PNG or GIF files without opening a window.
+"""
+
+import numpy as np
+import pygame
+import infect_sim as infect
+
+# Size of each cell on screen and of the margin between cells, in pixels
+CELL = 6
+MARGIN = 1
+
+# RGB Colors
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+GREEN = (0, 255, 0)
+OLIVE = (75, 150, 0)
+BLUE = (0, 0, 255)
+
+# The color of a person in each state, indexed by state code
+STATE_COLORS = np.array([
+    BLACK,  # Unaffected
+    GREEN,  # Infectious
+    BLUE,  # Recovered
+    RED  # Dead
+], dtype=np.uint8)
+
+
+def render(rows, cols, state, interaction_rate, env_dim):
+    """Render an environment as an RGB array. Empty cells are white, cells
+    within the interaction rate of an infectious person, their mask, are
+    olive and people are colored by their state.
+
+    Args:
+        rows (array): The row of each person, -1 if removed
+        cols (array): The column of each person
+        state (array): The state of each person
+        interaction_rate (array): The interaction rate of each person
+        env_dim (int): The size of the environment
+
+    Return:
+        array: The color of each cell, of shape (env_dim, env_dim, 3)
+    """
+
+    image = np.empty((env_dim, env_dim, 3), dtype=np.uint8)
+    image[...] = WHITE
+
+    placed = np.flatnonzero(rows >= 0)
+    flat = rows[placed].astype(np.int64) * env_dim + cols[placed]
+
+    # Stamp the disc of each infectious person's interaction rate onto the
+    # mask, one radius at a time
+    mask = np.zeros(env_dim * env_dim, dtype=bool)
+    infectious = placed[state[placed] == infect.INFECTIOUS]
+    radii = interaction_rate[infectious]
+    for radius in np.unique(radii[radii >= 0]):
+        centers = infectious[radii == radius]
+        row_offsets, col_offsets = infect.disc_offsets(radius)
+        mask_rows = (rows[centers, None] + row_offsets) % env_dim
+        mask_cols = (cols[centers, None] + col_offsets) % env_dim
+        mask[mask_rows * env_dim + mask_cols] = True
+    image.reshape(-1, 3)[mask] = OLIVE
+
+    # Draw in the people
+    image.reshape(-1, 3)[flat] = STATE_COLORS[state[placed]]
+
+    return image
+
+
+class Renderer:
+    """Draw rendered environments scaled up onto PyGame surfaces, with a
+    black margin between cells.
+
+    Args:
+        env_dim (int): The size of the environment
+        cell (int): The size of each cell in pixels
+        margin (int): The size of the margin between cells in pixels
+    """
+
+    def __init__(self, env_dim, cell=CELL, margin=MARGIN):
+        self.env_dim = env_dim
+        self.margin = margin
+        self.scaled = env_dim * (cell + margin)
+        self.size = self.scaled + margin
+
+        # The margins are drawn once and blitted over each frame, with
+        # everything else transparent
+        self.grid_lines = pygame.Surface((self.size, self.size))
+        self.grid_lines.fill(WHITE)
+        self.grid_lines.set_colorkey(WHITE)
+        if margin > 0:
+            for line in range(0, self.size, cell + margin):
+                pygame.draw.rect(self.grid_lines, BLACK,
+                                 [line, 0, margin, self.size])
+                pygame.draw.rect(self.grid_lines, BLACK,
+                                 [0, line, self.size, margin])
+
+    def draw(self, surface, image):
+        """Draw a rendered environment onto a surface.
+
+        Args:
+            surface (Surface): The surface to draw on, at least size pixels
+                wide and high
+            image (array): The rendered environment, see render()
+        """
+
+        # Surfaces are indexed by x then y, ie. by column then row
+        frame = pygame.surfarray.make_surface(image.swapaxes(0, 1))
+        surface.blit(pygame.transform.scale(frame, (self.scaled, self.scaled)),
+                     (self.margin, self.margin))
+        surface.blit(self.grid_lines, (0, 0))
+
+    def surface(self):
+        """Make an off screen surface to draw on without a window.
+
+        Return:
+            Surface: A surface of the renderer's size
+        """
+        return pygame.Surface((self.size, self.size))
+
+
+class FrameWriter:
+    """Write drawn frames to files without a window. A path ending in .gif
+    is written as one animated GIF when the writer is closed, which needs
+    the Pillow package. Any other path is a pattern for a PNG file per frame
+    formatted with the epoch, eg. 'frames/{epoch:05d}.png'.
+
+    Args:
+        path (str): The GIF file or the pattern of the PNG files
+        delay (int): Milliseconds between the frames of a GIF
+    """
+
+    def __init__(self, path, delay=250):
+        self.path = path
+        self.delay = delay
+        self.frames = None
+        if path.lower().endswith('.gif'):
+            try:
+                from PIL import Image
+            except ImportError as error:
+                raise ImportError('Writing GIFs needs the Pillow package.') \
+                    from error
+            self.image = Image
+            self.frames = []
+
+    def write(self, surface, epoch):
+        """Write a frame.
+
+        Args:
+            surface (Surface): The drawn frame
+            epoch (int): The time step of the frame
+        """
+
+        if self.frames is None:
+            pygame.image.save(surface, self.path.format(epoch=epoch))
+        else:
+            self.frames.append(self.image.fromarray(
+                pygame.surfarray.array3d(surface).swapaxes(0, 1)))
+
+    def close(self):
+        """Write out the GIF, if writing one.
+        """
+
+        if self.frames:
+            self.frames[0].save(self.path, save_all=True,
+                                append_images=self.frames[1:],
+                                duration=self.delay, loop=0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
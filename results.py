@@ -0,0 +1,271 @@
+"""Summary statistics of completed simulations. A Results converts the lists
+of a report to NumPy arrays once and works out each statistic the first
+time it is asked for, and a ResultsSet reduces many Results, eg. the
+replicates of an ensemble, with array operations over all of them at once:
+
+    results = env.results()
+    print(results.peak_infectious, results.peak_epoch, results.attack_rate)
+"""
+
+from functools import cached_property
+import numpy as np
+import infect_sim as infect
+
+# The report keys counting people, in the order of the compartments
+COMPARTMENTS = ('not_infected', 'infectious', 'recovered', 'dead')
+
+
+class Results:
+    """The report of a simulation as read-only arrays with memoised
+    statistics derived from it.
+
+    Args:
+        report (dict): The report, holding a list or array for each of
+            infect_sim.REPORT_KEYS
+        infectious_period (float): The mean number of time steps people are
+            infectious for, needed for the effective R series
+    """
+
+    def __init__(self, report, infectious_period=None):
+        self.series = {}
+        for key in infect.REPORT_KEYS:
+            self.series[key] = np.array(report[key])
+            self.series[key].flags.writeable = False
+        self.stop_reason = report.get('stop_reason')
+        self.infectious_period = infectious_period
+
+    @classmethod
+    def from_env(cls, env):
+        """Get the results of a simulation.
+
+        Args:
+            env (Environment): The simulation
+
+        Return:
+            Results: The results of its report
+
+        Raises:
+            ValueError: If the report wasn't kept
+        """
+
+        if not env.keep_report:
+            raise ValueError('Results need the report to be kept.')
+        return cls(env.report, env.recovery_mean)
+
+    def __getitem__(self, key):
+        return self.series[key]
+
+    def __len__(self):
+        return len(self.series['infectious'])
+
+    @cached_property
+    def epochs(self):
+        """The number of time steps run.
+        """
+        return len(self) - 1
+
+    @cached_property
+    def pop_size(self):
+        """The number of people in the population.
+        """
+        return int(sum(self.series[key][0] for key in COMPARTMENTS))
+
+    @cached_property
+    def peak_epoch(self):
+        """The first time step with the most infectious people.
+        """
+        return int(np.argmax(self.series['infectious']))
+
+    @cached_property
+    def peak_infectious(self):
+        """The most people infectious at once.
+        """
+        return int(self.series['infectious'][self.peak_epoch])
+
+    @cached_property
+    def max_r_naught(self):
+        """The largest R naught reached.
+        """
+        return float(self.series['r_naught'].max())
+
+    @cached_property
+    def cumulative_incidence(self):
+        """The number of people ever infected by each time step.
+        """
+        return self.pop_size - self.series['not_infected']
+
+    @cached_property
+    def incidence(self):
+        """The number of people infected during each time step, counting
+        those initially infected in the first.
+        """
+        return np.diff(self.cumulative_incidence, prepend=0)
+
+    @cached_property
+    def attack_rate(self):
+        """The fraction of the population ever infected.
+        """
+        return float(self.cumulative_incidence[-1] / self.pop_size)
+
+    @cached_property
+    def final_sizes(self):
+        """The number of people in each compartment at the end.
+        """
+        return {key: int(self.series[key][-1]) for key in COMPARTMENTS}
+
+    @cached_property
+    def doubling_time(self):
+        """The number of time steps until twice as many people had been
+        infected as at the start, or NaN if that never happened.
+        """
+
+        cumulative = self.cumulative_incidence
+        doubled = np.flatnonzero(cumulative >= 2 * cumulative[0])
+        if cumulative[0] == 0 or doubled.size == 0:
+            return float('nan')
+        return float(doubled[0])
+
+    @cached_property
+    def effective_r(self):
+        """The effective reproduction number at each time step, estimated as
+        the people infected per infectious person during the time step times
+        the infectious period. NaN when no one was infectious.
+
+        Raises:
+            ValueError: If the infectious period isn't known
+        """
+
+        if self.infectious_period is None:
+            raise ValueError('The effective R needs the infectious period.')
+
+        infectious = self.series['infectious'][:-1].astype(float)
+        effective_r = np.full(len(self), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            effective_r[1:] = np.where(
+                infectious > 0,
+                self.incidence[1:] / infectious * self.infectious_period,
+                np.nan)
+        effective_r.flags.writeable = False
+        return effective_r
+
+
+class ResultsSet:
+    """Many Results reduced together. Each report time series is stacked into
+    one array with a row per simulation, padding those that ended early with
+    their final values, so statistics across all of them are single array
+    operations.
+
+    Args:
+        results (list): The Results of each simulation
+    """
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.stacked = {}
+
+    @classmethod
+    def from_reports(cls, reports, infectious_period=None):
+        """Collect the reports of many simulations.
+
+        Args:
+            reports (list): The reports
+            infectious_period (float): See Results
+
+        Return:
+            ResultsSet: The results of the reports
+        """
+        return cls(Results(report, infectious_period) for report in reports)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __getitem__(self, key):
+        """Stack a report time series of every simulation.
+
+        Args:
+            key (str): The report key
+
+        Return:
+            array: The series of shape (simulations, longest series)
+        """
+
+        if key not in self.stacked:
+            series = [results[key] for results in self.results]
+            lengths = np.array([len(values) for values in series])
+            values = np.concatenate(series)
+
+            # Fill each row up to its length from the concatenated series,
+            # and the rest with its last value
+            inside = np.arange(lengths.max()) < lengths[:, None]
+            stacked = np.empty(inside.shape, values.dtype)
+            stacked[inside] = values
+            stacked[~inside] = np.repeat(values[np.cumsum(lengths) - 1],
+                                         lengths.max() - lengths)
+            stacked.flags.writeable = False
+            self.stacked[key] = stacked
+
+        return self.stacked[key]
+
+    def stat(self, name):
+        """Collect a statistic of each Results, eg. 'doubling_time'.
+
+        Args:
+            name (str): The name of the statistic
+
+        Return:
+            array: The statistic of each simulation
+        """
+        return np.array([getattr(results, name) for results in self.results])
+
+    def quantiles(self, key, quantiles):
+        """Compute quantiles of a report time series across the simulations
+        at each time step.
+
+        Args:
+            key (str): The report key
+            quantiles (tuple): The quantiles to compute
+
+        Return:
+            array: The quantiles, of shape (len(quantiles), time steps)
+        """
+        return np.quantile(self[key].astype(float), quantiles, axis=0)
+
+    @cached_property
+    def epochs(self):
+        """The number of time steps each simulation ran.
+        """
+        return np.array([len(results) for results in self.results]) - 1
+
+    @cached_property
+    def peak_infectious(self):
+        """The most people infectious at once in each simulation.
+        """
+        return self['infectious'].max(axis=1)
+
+    @cached_property
+    def peak_epoch(self):
+        """The first time step with the most infectious people in each
+        simulation.
+        """
+        return self['infectious'].argmax(axis=1)
+
+    @cached_property
+    def max_r_naught(self):
+        """The largest R naught reached in each simulation.
+        """
+        return self['r_naught'].max(axis=1)
+
+    @cached_property
+    def final_sizes(self):
+        """The number of people in each compartment at the end of each
+        simulation.
+        """
+        return {key: self[key][:, -1] for key in COMPARTMENTS}
+
+    @cached_property
+    def attack_rate(self):
+        """The fraction of the population ever infected in each simulation.
+        """
+
+        pop_size = sum(self[key][:, 0] for key in COMPARTMENTS)
+        return (pop_size - self['not_infected'][:, -1]) / pop_size
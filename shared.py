@@ -0,0 +1,256 @@
+"""NumPy arrays in named shared memory, so worker processes, renderers and
+analysis tools can map the state of a simulation without pickling or
+copying it, and double buffered frames of that state for reading it
+consistently while the simulation runs.
+"""
+
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+
+def _attach_block(name, untrack):
+    """Map an existing block of shared memory.
+
+    Args:
+        name (str): The name of the block
+        untrack (bool): Stop the resource tracker of this process unlinking
+            the block when the process exits
+    """
+
+    if not untrack:
+        return shared_memory.SharedMemory(name=name)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every process mapping a block tracks it
+        block = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(block._name, 'shared_memory')
+        return block
+
+
+class SharedArrays:
+    """A set of named arrays, each in its own block of shared memory. The
+    process that creates them owns the blocks and unlinks them on close(),
+    other processes map them from the spec with attach().
+
+    Args:
+        blocks (dict): The shared memory block of each array
+        arrays (dict): The array viewing each block
+        owner (bool): If True the blocks are unlinked on close()
+    """
+
+    def __init__(self, blocks, arrays, owner):
+        self.blocks = blocks
+        self.arrays = arrays
+        self.owner = owner
+
+    @classmethod
+    def create(cls, arrays):
+        """Copy arrays into new blocks of shared memory.
+
+        Args:
+            arrays (dict): The arrays to share by name
+
+        Return:
+            SharedArrays: The shared copies
+        """
+
+        blocks, shared = {}, {}
+        for name, array in arrays.items():
+            # Blocks can't be empty
+            blocks[name] = shared_memory.SharedMemory(
+                create=True, size=max(1, array.nbytes))
+            shared[name] = np.ndarray(array.shape, array.dtype,
+                                      buffer=blocks[name].buf)
+            shared[name][...] = array
+        return cls(blocks, shared, owner=True)
+
+    @classmethod
+    def attach(cls, spec, readonly=False, untrack=False):
+        """Map arrays shared by another process. Child processes of the owner
+        share its resource tracker, other processes should untrack the blocks
+        so they aren't unlinked when the process exits.
+
+        Args:
+            spec (dict): The spec of the arrays, see SharedArrays.spec
+            readonly (bool): Map the arrays read-only
+            untrack (bool): Don't track the blocks in this process
+
+        Return:
+            SharedArrays: The mapped arrays
+        """
+
+        blocks, arrays = {}, {}
+        for name, (block_name, shape, dtype) in spec.items():
+            blocks[name] = _attach_block(block_name, untrack)
+            arrays[name] = np.ndarray(shape, dtype, buffer=blocks[name].buf)
+            if readonly:
+                arrays[name].flags.writeable = False
+        return cls(blocks, arrays, owner=False)
+
+    @property
+    def spec(self):
+        """The block name, shape and dtype of each array, which is all
+        another process needs to attach() to them and can be pickled.
+        """
+        return {name: (self.blocks[name].name, array.shape, array.dtype.str)
+                for name, array in self.arrays.items()}
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def close(self):
+        """Unmap the arrays, and unlink them if this process owns them. The
+        arrays can't be used afterwards.
+        """
+
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            if self.owner:
+                block.unlink()
+        self.blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Frames:
+    """Double buffered frames of a set of arrays, published by one process
+    once per time step and read by any number of others without stopping
+    the publisher.
+
+    Frames are written to two buffers in turn. Each buffer has a sequence
+    number that is odd while it is being written, so a reader can tell if a
+    frame it read was overwritten part way through. A frame is only
+    overwritten two publishes after it was written, which gives readers a
+    whole time step to use it.
+
+    Args:
+        arrays (SharedArrays): The two buffers of each array, and the control
+            block holding the number of frames published and the sequence
+            number and epoch of each buffer
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        self.control = arrays['control']
+        self.names = [name for name in arrays.arrays if name != 'control']
+
+    @classmethod
+    def create(cls, templates):
+        """Allocate frames in shared memory.
+
+        Args:
+            templates (dict): An array of the shape and dtype of each array
+                of a frame by name
+
+        Return:
+            Frames: The empty frames
+        """
+
+        arrays = {name: np.zeros((2, *array.shape), array.dtype)
+                  for name, array in templates.items()}
+        # Frames published, then sequence number and epoch of each buffer
+        arrays['control'] = np.zeros(5, dtype=np.int64)
+        return cls(SharedArrays.create(arrays))
+
+    @classmethod
+    def attach(cls, spec, untrack=True):
+        """Map frames published by another process read-only.
+
+        Args:
+            spec (dict): The spec of the frames, see Frames.spec
+            untrack (bool): Don't track the blocks in this process, see
+                SharedArrays.attach()
+
+        Return:
+            Frames: The mapped frames
+        """
+        return cls(SharedArrays.attach(spec, readonly=True, untrack=untrack))
+
+    @property
+    def spec(self):
+        """The spec another process needs to attach() to the frames.
+        """
+        return self.arrays.spec
+
+    def publish(self, epoch, **arrays):
+        """Copy the arrays of a time step into the next buffer.
+
+        Args:
+            epoch (int): The time step of the frame
+            **arrays: The array of the frame for each name
+        """
+
+        control = self.control
+        buffer = control[0] % 2
+        control[1 + buffer] += 1  # Odd while writing
+        for name in self.names:
+            self.arrays[name][buffer] = arrays[name]
+        control[3 + buffer] = epoch
+        control[1 + buffer] += 1
+        control[0] += 1
+
+    def latest(self):
+        """Get views of the most recently published frame without copying
+        it. Check the frame is still valid() after using it.
+
+        Return:
+            dict: The epoch, buffer and sequence number of the frame and a
+                view of each of its arrays, or None if there are no complete
+                frames
+        """
+
+        while True:
+            published = int(self.control[0])
+            if published == 0:
+                return None
+            buffer = (published - 1) % 2
+            sequence = int(self.control[1 + buffer])
+            if sequence % 2:
+                continue  # Overwritten since it was published
+            frame = {name: self.arrays[name][buffer] for name in self.names}
+            frame.update(epoch=int(self.control[3 + buffer]), buffer=buffer,
+                         sequence=sequence)
+            if self.valid(frame):
+                return frame
+
+    def valid(self, frame):
+        """Check a frame from latest() hasn't been overwritten since.
+
+        Args:
+            frame (dict): The frame
+
+        Return:
+            bool: True if the frame is intact
+        """
+        return self.control[1 + frame['buffer']] == frame['sequence']
+
+    def read(self):
+        """Copy the most recently published frame, retrying if it is
+        overwritten while being copied.
+
+        Return:
+            dict: The epoch of the frame and a copy of each of its arrays, or
+                None if there are no complete frames
+        """
+
+        while True:
+            frame = self.latest()
+            if frame is None:
+                return None
+            copy = {name: frame[name].copy() for name in self.names}
+            if self.valid(frame):
+                return dict(copy, epoch=frame['epoch'])
+
+    def close(self):
+        """Unmap the frames, and unlink them if this process published them.
+        """
+        self.arrays.close()
@@ -0,0 +1,162 @@
+"""Sinks that stream the record of each time step of a simulation to a file
+as it runs. Attach them with Environment.add_sink().
+
+Each record is a dict of the epoch and the report values for that time step.
+Records are buffered and written in chunks, and the file is flushed after
+each chunk so other processes can follow a running simulation.
+"""
+
+import csv
+import json
+
+
+class EpochSink:
+    """Base class for sinks. Subclasses write a chunk of records with
+    write_chunk() and release their file with close().
+    """
+
+    def __init__(self, chunk_size=100):
+        self.chunk_size = chunk_size
+        self.buffer = []
+
+    def write(self, record):
+        """Buffer a record, writing the buffered records out once there is a
+        full chunk of them.
+
+        Args:
+            record (dict): The record of a time step
+        """
+
+        self.buffer.append(record)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write out any buffered records.
+        """
+
+        if self.buffer:
+            self.write_chunk(self.buffer)
+            self.buffer = []
+
+    def write_chunk(self, records):
+        """Write a chunk of records to the sink.
+
+        Args:
+            records (list): The records to write
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Write out any buffered records and close the sink.
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CSVSink(EpochSink):
+    """Write records as rows of a CSV file with a header row.
+    """
+
+    def __init__(self, path, chunk_size=100):
+        super().__init__(chunk_size)
+        self.file = open(path, 'w', newline='')
+        self.writer = None
+
+    def write_chunk(self, records):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(records[0]))
+            self.writer.writeheader()
+        self.writer.writerows(records)
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class NDJSONSink(EpochSink):
+    """Write records as a stream of newline delimited JSON objects.
+    """
+
+    def __init__(self, path, chunk_size=100):
+        super().__init__(chunk_size)
+        self.file = open(path, 'w')
+
+    def write_chunk(self, records):
+        self.file.write(''.join(json.dumps(record) + '\n'
+                                for record in records))
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+def _import_pyarrow(sink):
+    """Import the optional pyarrow package for a sink that needs it.
+    """
+
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ImportError(f'{sink} needs the pyarrow package.') from error
+    return pyarrow
+
+
+class ParquetSink(EpochSink):
+    """Write records to a Parquet file with one row group per chunk. Needs
+    the optional pyarrow package. The file can only be read once the sink is
+    closed, use ArrowSink to follow a running simulation.
+    """
+
+    def __init__(self, path, chunk_size=1000):
+        super().__init__(chunk_size)
+        self.pyarrow = _import_pyarrow('ParquetSink')
+        self.path = path
+        self.writer = None
+
+    def write_chunk(self, records):
+        table = self.pyarrow.Table.from_pylist(records)
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path,
+                                                             table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        super().close()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ArrowSink(EpochSink):
+    """Write records to an Arrow IPC stream with one record batch per chunk.
+    Needs the optional pyarrow package. The stream can be read while it is
+    being written.
+    """
+
+    def __init__(self, path, chunk_size=100):
+        super().__init__(chunk_size)
+        self.pyarrow = _import_pyarrow('ArrowSink')
+        self.file = open(path, 'wb')
+        self.writer = None
+
+    def write_chunk(self, records):
+        batch = self.pyarrow.RecordBatch.from_pylist(records)
+        if self.writer is None:
+            self.writer = self.pyarrow.ipc.new_stream(self.file, batch.schema)
+        self.writer.write_batch(batch)
+        self.file.flush()
+
+    def close(self):
+        super().close()
+        if self.writer is not None:
+            self.writer.close()
+        self.file.close()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""Sweep a grid of simulation parameters in parallel, caching the report of
+each point on disk so extended or interrupted sweeps only run the points that
+are missing.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import infect_sim as infect
+from ensemble import run_replicate
+from results import Results
+
+# Parameters that don't change the result of a simulation and so are left
+# out of cache keys
+IGNORED_PARAMS = ('debug',)
+
+# The modules whose source decides the results of a simulation, see
+# code_version()
+SOURCE_MODULES = ('infect_sim.py', 'kernels.py')
+
+
+def code_version():
+    """Get a short hash of the simulation source code so cached results are
+    not reused after the simulation changes.
+
+    Return:
+        str: The hash of every module in SOURCE_MODULES
+    """
+
+    source_dir = os.path.dirname(os.path.abspath(infect.__file__))
+    digest = hashlib.sha256()
+    for module in SOURCE_MODULES:
+        with open(os.path.join(source_dir, module), 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+
+def normalise(env_params):
+    """Normalise environment parameters so equal parameters always hash the
+    same, eg. 4 and 4.0 or NumPy and Python numbers.
+
+    Args:
+        env_params (dict): The environment parameters
+
+    Return:
+        dict: The normalised parameters
+    """
+
+    normalised = {}
+    for key, value in env_params.items():
+        if key in IGNORED_PARAMS:
+            continue
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        normalised[key] = value
+
+    return normalised
+
+
+def cache_key(env_params, seed, version):
+    """Hash the normalised environment parameters, seed and code version of
+    a simulation.
+
+    Args:
+        env_params (dict): The environment parameters
+        seed (int): The seed of the simulation
+        version (str): The code version, see code_version()
+
+    Return:
+        str: The cache key
+    """
+
+    key = json.dumps({
+        'env_params': normalise(env_params),
+        'seed': seed,
+        'version': version
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ResultCache:
+    """An on-disk cache of simulation reports with one JSON file per key.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        """Get the path of the file for a cache key.
+        """
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        """Get a cached report.
+
+        Args:
+            key (str): The cache key
+
+        Return:
+            dict: The report or None if it isn't cached
+        """
+
+        try:
+            with open(self.path(key)) as cache_file:
+                return json.load(cache_file)['report']
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, env_params, seed, report):
+        """Cache a report. The file is written under a temporary name first
+        so an interrupted write never leaves a partial entry.
+
+        Args:
+            key (str): The cache key
+            env_params (dict): The environment parameters, kept for reference
+            seed (int): The seed of the simulation
+            report (dict): The report to cache, holding plain lists
+        """
+
+        entry = {
+            'env_params': normalise(env_params),
+            'seed': seed,
+            'report': report
+        }
+        temp_path = self.path(key) + '.tmp'
+        with open(temp_path, 'w') as cache_file:
+            json.dump(entry, cache_file)
+        os.replace(temp_path, self.path(key))
+
+
+def grid_points(grid):
+    """Get every combination of the values in a parameter grid.
+
+    Args:
+        grid (dict): A list of values for each parameter to sweep
+
+    Return:
+        list: A dict of parameter values for each point
+    """
+
+    keys = sorted(grid)
+    return [dict(zip(keys, values))
+            for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def run_sweep(env_params, grid, seed=0, cache_dir='sweep_cache',
+              max_workers=None, on_result=None):
+    """Run a simulation for each point of a parameter grid in parallel,
+    skipping points that are already cached.
+
+    Args:
+        env_params (dict): The environment parameters shared by every point
+        grid (dict): A list of values for each parameter to sweep
+        seed (int): The seed used for every point
+        cache_dir (str): The directory of the result cache
+        max_workers (int): The number of worker processes, by default one
+            per core
+        on_result (callable): Called with each point, its report and whether
+            it came from the cache as it becomes available
+
+    Return:
+        list: The point and report for each point of the grid, in grid order
+
+    Raises:
+        ValueError: If a point doesn't keep its report
+    """
+
+    cache = ResultCache(cache_dir)
+    version = code_version()
+    points = grid_points(grid)
+    reports = [None] * len(points)
+
+    # Use cached results where possible
+    missing = {}
+    for index, point in enumerate(points):
+        params = {**env_params, **point}
+        if not params.get('keep_report', True):
+            raise ValueError(f'Sweeps need the report to be kept, but '
+                             f'keep_report is off for {point}.')
+        key = cache_key(params, seed, version)
+        reports[index] = cache.get(key)
+        if reports[index] is None:
+            missing[index] = (params, key)
+        elif on_result is not None:
+            on_result(point, reports[index], True)
+
+    # Run the rest, caching each one as soon as it finishes so an
+    # interrupted sweep can pick up where it stopped
+    if missing:
+        with ProcessPoolExecutor(max_workers) as pool:
+            futures = {
+                pool.submit(run_replicate, params,
+                            np.random.SeedSequence(seed)): index
+                for index, (params, _) in missing.items()
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                params, key = missing[index]
+                # Store plain lists like the cached reports
+                reports[index] = {name: np.asarray(series).tolist()
+                                  for name, series in future.result().items()}
+                cache.put(key, params, seed, reports[index])
+                if on_result is not None:
+                    on_result(points[index], reports[index], False)
+
+    return list(zip(points, reports))
+
+
+def main():
+    """Sweep the parameters exposed by the GUI from the command line and
+    report the peak infectious, deaths and max R naught of each point.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-g', '--grid', default=None,
+                        help='JSON file with a list of values for each '
+                             'parameter to sweep')
+    parser.add_argument('-p', '--params', default=None,
+                        help='JSON file of environment parameters to use '
+                             'instead of the presets')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='seed used for every point')
+    parser.add_argument('-c', '--cache-dir', default='sweep_cache',
+                        help='directory of the result cache')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    # Set up environmental parameters for simulation
+    env_params = {
+        'time_steps': 0,  # Run the sim until there are no infectious people
+        'env_dim': 100,
+        'pop_size': 1000,
+        'initially_infected': 3,
+        'interaction_rate': 3,
+        'infection_rate': .4,  # Percent likelihood of spreading the disease
+        'mortality_rate': .02,  # Percent likelihood of dieing from the disease
+        'recovery_mean': 19,  # Mean number of days it takes to recover
+        'recovery_sd': 3,  # Standard deviation of days it takes to recover
+        'asymptomatic_prob': 0.25,  # Probability of being asymptomatic
+        'days_until_infectious': 2
+    }
+    if args.params is not None:
+        with open(args.params) as params_file:
+            env_params.update(json.load(params_file))
+
+    # Sweep the GUI sliders by default
+    grid = {
+        'interaction_rate': [1, 3, 5],
+        'infection_rate': [0.2, 0.4],
+        'asymptomatic_prob': [0.25, 0.5],
+        'days_until_infectious': [2, 4]
+    }
+    if args.grid is not None:
+        with open(args.grid) as grid_file:
+            grid = json.load(grid_file)
+
+    def on_result(point, report, cached):
+        source = 'cached' if cached else 'ran'
+        results = Results(report)
+        print(f'{source}: {point} -> peak infectious '
+              f'{results.peak_infectious}, dead '
+              f'{results.final_sizes["dead"]}, max R naught '
+              f'{results.max_r_naught}', file=sys.stderr)
+
+    points = run_sweep(env_params, grid, args.seed, args.cache_dir,
+                       args.workers, on_result)
+
+    summaries = []
+    for point, report in points:
+        results = Results(report)
+        summaries.append({'point': point,
+                          'peak_infectious': results.peak_infectious,
+                          'dead': results.final_sizes['dead'],
+                          'max_r_naught': results.max_r_naught})
+    print(json.dumps(summaries, indent=2))
+
+
+if __name__ == '__main__':
+    main()